@@ -6,12 +6,35 @@ Respects toggle states (enabled/disabled, default/dynamic) from the active hub's
 The active hub is determined by ~/contextmanager/master-config.json.
 """
 
+import argparse
+import array
+import asyncio
+import contextvars
+import functools
+import hashlib
+import heapq
 import json
 import logging
+import math
 import mimetypes
+import mmap
+import os
 import pathlib
+import queue
+import random
+import re
+import shutil
+import sqlite3
 import sys
-from typing import Dict, List, Optional
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
 
 # Setup logging for debugging
 logging.basicConfig(
@@ -23,27 +46,48 @@ logging.basicConfig(
 logging.info(f"Starting MCP Server. Python executable: {sys.executable}")
 
 try:
-    from fastmcp import FastMCP
+    from fastmcp import Context, FastMCP
+    from fastmcp.resources import Resource
+    from fastmcp.server.dependencies import get_http_headers
+    from fastmcp.server.middleware import Middleware
+    from fastmcp.server.providers import Provider
+    from mcp.server.subscriptions import (
+        InMemorySubscriptionBus,
+        ListenHandler,
+        ResourcesListChanged,
+        ResourceUpdated,
+        ToolsListChanged,
+    )
+    from mcp.types import SubscriptionsListenRequestParams
 except ImportError as e:
     logging.critical(f"Failed to import fastmcp: {e}")
     sys.exit(1)
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional; HubWatcher falls back to polling
+    FileSystemEventHandler = object
+    Observer = None
+
 # Configuration
 STORAGE_DIR = pathlib.Path.home() / "contextmanager"
 HUBS_BASE_DIR = STORAGE_DIR / "hubs"
 MASTER_CONFIG_PATH = STORAGE_DIR / "master-config.json"
 
 
-def _get_active_hub_paths() -> tuple:
-    """Determine the active hub and return path variables."""
-    master_config = {}
+def _read_master_config() -> dict:
+    """Read master-config.json, returning an empty dict on any error."""
     if MASTER_CONFIG_PATH.exists():
         try:
-            master_config = json.loads(MASTER_CONFIG_PATH.read_text(encoding="utf-8"))
+            return json.loads(MASTER_CONFIG_PATH.read_text(encoding="utf-8"))
         except Exception as e:
             logging.error(f"Error reading master config: {e}")
+    return {}
+
 
-    active_hub = master_config.get("active_hub", "MySkillHub")
+def _hub_paths_for(active_hub: str) -> tuple:
+    """Return (CONTEXTS_DIR, SKILLS_DIR, CONFIG_PATH) for a hub name."""
     HUB_DIR = HUBS_BASE_DIR / active_hub
 
     CONTEXTS_DIR = HUB_DIR / "contexts"
@@ -53,22 +97,59 @@ def _get_active_hub_paths() -> tuple:
     return CONTEXTS_DIR, SKILLS_DIR, CONFIG_PATH
 
 
+def _get_active_hub_paths() -> tuple:
+    """Determine the active hub and return path variables."""
+    snapshot = _catalog.current()
+    return snapshot.contexts_dir, snapshot.skills_dir, snapshot.config_path
+
+
 def _get_active_hub_name() -> str:
     """Get the name of the currently active hub."""
-    master_config = {}
-    if MASTER_CONFIG_PATH.exists():
-        try:
-            master_config = json.loads(MASTER_CONFIG_PATH.read_text(encoding="utf-8"))
-        except Exception as e:
-            logging.error(f"Error reading master config: {e}")
-
-    return master_config.get("active_hub", "MySkillHub")
+    return _catalog.current().hub_name
 
 
 # Also support legacy path
 LEGACY_RESOURCES_DIR = pathlib.Path.home() / "skills-resources"
 LEGACY_SKILLS_DIR = LEGACY_RESOURCES_DIR / "skills"
 
+# Worker threads for concurrent skill file reads (SKILLS_MCP_IO_WORKERS, default 8)
+IO_WORKERS = int(os.environ.get("SKILLS_MCP_IO_WORKERS", "8"))
+
+# Worker threads running tool calls off the event loop (SKILLS_MCP_TOOL_WORKERS, default 16)
+TOOL_WORKERS = int(os.environ.get("SKILLS_MCP_TOOL_WORKERS", "16"))
+
+# Per-hub folder for the server's persistent indexes
+CACHE_DIR_NAME = ".mcp-cache"
+
+# Memory cap for assembled skill contexts (SKILLS_MCP_CACHE_MB, default 64 MB)
+CONTEXT_CACHE_MAX_BYTES = int(os.environ.get("SKILLS_MCP_CACHE_MB", "64")) * 1024 * 1024
+
+# Responses larger than this are split into pages (SKILLS_MCP_PAGE_KB, 0 disables)
+PAGE_BYTES = int(os.environ.get("SKILLS_MCP_PAGE_KB", "256")) * 1024
+
+# Shared daemon mode (--http): address the stdio shim forwards to
+HTTP_HOST = os.environ.get("SKILLS_MCP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("SKILLS_MCP_PORT", "8765"))
+# Sent by mcp_shim.py so the daemon can tell its stdio clients apart
+SESSION_HEADER = "x-skills-session"
+
+# Storage backend for listing and search: "files" (default) or "sqlite"
+STORAGE_BACKEND = os.environ.get("SKILLS_MCP_BACKEND", "files").lower()
+
+# Periodic JSONL metrics dump (SKILLS_MCP_METRICS_INTERVAL seconds, 0 disables)
+METRICS_PATH = pathlib.Path(
+    os.environ.get("SKILLS_MCP_METRICS_FILE", "/tmp/skills_mcp_metrics.jsonl")
+)
+METRICS_INTERVAL = float(os.environ.get("SKILLS_MCP_METRICS_INTERVAL", "60"))
+
+# Hub watcher: 0 disables it; otherwise the polling interval in seconds used
+# when watchdog is not installed (SKILLS_MCP_WATCH_INTERVAL, default 2)
+WATCH_INTERVAL = float(os.environ.get("SKILLS_MCP_WATCH_INTERVAL", "2"))
+
+# Skills prefetched into the content cache from the usage log at startup and
+# after discovery or load calls; 0 disables the usage log and prefetching
+PREFETCH_SKILLS = int(os.environ.get("SKILLS_MCP_PREFETCH", "8"))
+
 # Convention: Each skill is a separate folder inside context folders or SKILLS_DIR
 # Files:
 # - 'skill.md': The main system prompt/instruction with YAML frontmatter containing 'description'.
@@ -78,20 +159,194 @@ LEGACY_SKILLS_DIR = LEGACY_RESOURCES_DIR / "skills"
 
 mcp = FastMCP(name="Structured Skills Hub")
 
+# Bounded pool for file reads. Only submit to it from request threads, never
+# from inside a pool task, so it cannot deadlock on itself.
+_io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="skills-io")
 
-# Log storage directory info and active hub
-contexts_dir, skills_dir, config_path = _get_active_hub_paths()
-logging.info(f"Storage dir: {STORAGE_DIR}")
-logging.info(f"Active hub: {_get_active_hub_name()}")
-logging.info(f"Contexts dir: {contexts_dir}")
-logging.info(f"Skills dir: {skills_dir}")
+# Bounded pool the async tools run their blocking filesystem work on. Tool
+# bodies submit to _io_pool, never to this pool, so neither can starve itself.
+_tool_pool = ThreadPoolExecutor(
+    max_workers=TOOL_WORKERS, thread_name_prefix="skills-tool"
+)
+
+
+async def _off_loop(fn, *args):
+    """Run blocking fn(*args) on _tool_pool with the caller's context variables."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _tool_pool, functools.partial(context.run, fn, *args)
+    )
+
+
+class ServerStats:
+    """
+    Per-tool call instrumentation.
+
+    Each instrumented tool call records wall time, time per stage (config load,
+    catalog resolve, file read, assembly; stages may nest), bytes and files
+    read and the response size. Aggregates are kept per tool and exposed by
+    get_server_stats() and the periodic JSONL dump.
+    """
+
+    RECENT_CALLS = 200
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._tools: Dict[str, Dict] = {}
+        self.started = time.time()
+        self.calls_since_dump = 0
+
+    def _current(self) -> Optional[Dict]:
+        return getattr(self._local, "call", None)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of work as a named stage of the current call."""
+        call = self._current()
+        if call is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            call["stages"][name] = call["stages"].get(name, 0.0) + elapsed
+
+    def record_read(self, nbytes: int, nfiles: int = 1) -> None:
+        call = self._current()
+        if call is not None:
+            with self._lock:
+                call["bytes_read"] += nbytes
+                call["files_read"] += nfiles
+
+    def bind(self, fn):
+        """
+        Wrap fn so that reads it records on another thread (e.g. an _io_pool
+        worker) count towards the calling thread's current call.
+        """
+        call = self._current()
+        if call is None:
+            return fn
+
+        def bound(*args, **kwargs):
+            self._local.call = call
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.call = None
+
+        return bound
+
+    def instrument(self, fn):
+        """
+        Decorator turning a blocking tool body into an async tool: each call
+        runs on _tool_pool (with the caller's context variables, so the MCP
+        Context keeps working) and records one call record.
+        """
+
+        def run(*args, **kwargs):
+            if self._current() is not None:
+                return fn(*args, **kwargs)
+            call = {"stages": {}, "bytes_read": 0, "files_read": 0}
+            self._local.call = call
+            start = time.perf_counter()
+            error = False
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            except Exception:
+                error = True
+                raise
+            finally:
+                self._local.call = None
+                call["wall_ms"] = (time.perf_counter() - start) * 1000
+                call["response_bytes"] = _response_size(result)
+                self._finish(fn.__name__, call, error)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await _off_loop(functools.partial(run, *args, **kwargs))
+
+        return wrapper
+
+    def _finish(self, tool: str, call: Dict, error: bool) -> None:
+        stages = ", ".join(f"{k}={v:.1f}ms" for k, v in call["stages"].items())
+        logging.debug(
+            f"{tool}: {call['wall_ms']:.1f}ms [{stages}] read "
+            f"{call['files_read']} files/{call['bytes_read']}B, "
+            f"response {call['response_bytes']}B"
+        )
+        with self._lock:
+            agg = self._tools.setdefault(
+                tool,
+                {
+                    "calls": 0,
+                    "errors": 0,
+                    "wall_ms_total": 0.0,
+                    "wall_ms_max": 0.0,
+                    "stages_ms_total": defaultdict(float),
+                    "bytes_read": 0,
+                    "files_read": 0,
+                    "response_bytes": 0,
+                    "recent_wall_ms": deque(maxlen=self.RECENT_CALLS),
+                },
+            )
+            agg["calls"] += 1
+            agg["errors"] += int(error)
+            agg["wall_ms_total"] += call["wall_ms"]
+            agg["wall_ms_max"] = max(agg["wall_ms_max"], call["wall_ms"])
+            for name, ms in call["stages"].items():
+                agg["stages_ms_total"][name] += ms
+            agg["bytes_read"] += call["bytes_read"]
+            agg["files_read"] += call["files_read"]
+            agg["response_bytes"] += call["response_bytes"]
+            agg["recent_wall_ms"].append(call["wall_ms"])
+            self.calls_since_dump += 1
+
+    def snapshot(self) -> Dict:
+        """Aggregated per-tool numbers (means, p50/p95 over recent calls)."""
+        tools = {}
+        with self._lock:
+            for tool, agg in self._tools.items():
+                calls = agg["calls"]
+                recent = sorted(agg["recent_wall_ms"])
+                tools[tool] = {
+                    "calls": calls,
+                    "errors": agg["errors"],
+                    "wall_ms_mean": round(agg["wall_ms_total"] / calls, 3),
+                    "wall_ms_p50": round(recent[len(recent) // 2], 3),
+                    "wall_ms_p95": round(recent[int(len(recent) * 0.95)], 3),
+                    "wall_ms_max": round(agg["wall_ms_max"], 3),
+                    "stages_ms_mean": {
+                        k: round(v / calls, 3)
+                        for k, v in agg["stages_ms_total"].items()
+                    },
+                    "bytes_read": agg["bytes_read"],
+                    "files_read": agg["files_read"],
+                    "response_bytes_mean": agg["response_bytes"] // calls,
+                }
+        return {"uptime_s": round(time.time() - self.started, 1), "tools": tools}
+
+
+def _response_size(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    try:
+        return len(json.dumps(result, default=str).encode("utf-8"))
+    except Exception:
+        return 0
 
 
-def _load_config() -> dict:
+_stats = ServerStats()
+
+
+def _load_config(config_path: pathlib.Path) -> dict:
     """Load config.json to read toggle states."""
-    _, _, config_path = (
-        _get_active_hub_paths()
-    )  # Re-check active hub in case it changed
     if not config_path.exists():
         return {"context_cells": []}
     try:
@@ -101,70 +356,225 @@ def _load_config() -> dict:
         return {"context_cells": []}
 
 
-def _get_enabled_skills() -> List[Dict]:
-    """
-    Get all enabled skills from enabled context cells only.
-    Returns list of dicts: {name, path, mode}
-    Does NOT include library skills - only user-enabled skills from context cells.
-    """
-    # Ensure we're using the current active hub
-    contexts_dir, _, _ = _get_active_hub_paths()
-    config = _load_config()
+def _scan_context(ctx_dir: pathlib.Path, ctx: dict) -> List[Dict]:
+    """Collect the enabled skills/workflows of one context cell folder."""
     skills = []
+    if not ctx_dir.is_dir():
+        return skills
 
-    for ctx in config.get("context_cells", []):
-        # Skip disabled context cells
-        if not ctx.get("enabled", True):
-            continue
+    ctx_skills_config = ctx.get("skills", {})
+    ctx_workflows_config = ctx.get("workflows", {})
 
-        ctx_folder = ctx.get("folder", "")
-        ctx_dir = contexts_dir / ctx_folder
-        if not ctx_dir.is_dir():
+    for skill_dir in ctx_dir.iterdir():
+        if not skill_dir.is_dir():
             continue
 
-        ctx_skills_config = ctx.get("skills", {})
-        ctx_workflows_config = ctx.get("workflows", {})
+        # Check if this directory is configured as a skill
+        if skill_dir.name in ctx_skills_config:
+            skill_toggle = ctx_skills_config[skill_dir.name]
+            # Skip disabled skills
+            if not skill_toggle.get("enabled", True):
+                continue
 
-        for skill_dir in ctx_dir.iterdir():
-            if not skill_dir.is_dir():
+            skills.append(
+                {
+                    "name": skill_dir.name,
+                    "path": skill_dir,
+                    "mode": skill_toggle.get("mode", "always_loaded"),
+                    "type": "skill",
+                }
+            )
+        # Check if this directory is configured as a workflow
+        elif skill_dir.name in ctx_workflows_config:
+            workflow_toggle = ctx_workflows_config[skill_dir.name]
+            # Skip disabled workflows
+            if not workflow_toggle.get("enabled", True):
                 continue
 
-            # Check if this directory is configured as a skill
-            if skill_dir.name in ctx_skills_config:
-                skill_toggle = ctx_skills_config[skill_dir.name]
-                # Skip disabled skills
-                if not skill_toggle.get("enabled", True):
-                    continue
+            skills.append(
+                {
+                    "name": skill_dir.name,
+                    "path": skill_dir,
+                    "mode": workflow_toggle.get("mode", "always_loaded"),
+                    "type": "workflow",
+                }
+            )
 
-                skills.append(
-                    {
-                        "name": skill_dir.name,
-                        "path": skill_dir,
-                        "mode": skill_toggle.get("mode", "always_loaded"),
-                        "type": "skill",
-                    }
-                )
-            # Check if this directory is configured as a workflow
-            elif skill_dir.name in ctx_workflows_config:
-                workflow_toggle = ctx_workflows_config[skill_dir.name]
-                # Skip disabled workflows
-                if not workflow_toggle.get("enabled", True):
-                    continue
+    return skills
 
-                skills.append(
-                    {
-                        "name": skill_dir.name,
-                        "path": skill_dir,
-                        "mode": workflow_toggle.get("mode", "always_loaded"),
-                        "type": "workflow",
-                    }
-                )
 
-    return skills
+def _stat_key(path: pathlib.Path) -> Optional[tuple]:
+    """Return an (inode, size, mtime_ns) change key for a path, or None if missing."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class CatalogSnapshot(NamedTuple):
+    """Immutable view of the active hub's enabled skills at one point in time."""
+
+    version: int
+    hub_name: str
+    contexts_dir: pathlib.Path
+    skills_dir: pathlib.Path
+    config_path: pathlib.Path
+    config: dict
+    skills: tuple
+    by_name: Dict[str, Dict]
+
+
+class SkillCatalog:
+    """
+    Resident catalog of enabled skills for the active hub.
+
+    Built once at startup and rebuilt only when master-config.json, the hub's
+    config.json, the contexts directory or one of the enabled context folders
+    changes (inode/size/mtime). A freshness check costs a handful of stat()
+    calls instead of a full walk of every context cell, and a rebuild only
+    rescans the context folders whose stat key or toggles changed.
+
+    While a HubWatcher is attached the per-call freshness check is skipped
+    entirely; the watcher calls refresh() when something on disk changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watched: Dict[pathlib.Path, Optional[tuple]] = {}
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._version = 0
+        self._pinned = False
+        self._watcher_attached = False
+        # ctx_dir -> (stat key, toggles key, scanned skills)
+        self._ctx_scans: Dict[pathlib.Path, tuple] = {}
+
+    def _is_stale(self) -> bool:
+        if self._snapshot is None:
+            return True
+        for path, key in self._watched.items():
+            if _stat_key(path) != key:
+                return True
+        return False
+
+    def _scan_context_cached(
+        self, ctx_dir: pathlib.Path, ctx: dict, stat_key: Optional[tuple]
+    ) -> List[Dict]:
+        toggles = json.dumps(
+            [ctx.get("skills", {}), ctx.get("workflows", {})], sort_keys=True
+        )
+        cached = self._ctx_scans.get(ctx_dir)
+        if cached is not None and cached[0] == stat_key and cached[1] == toggles:
+            return cached[2]
+        skills = _scan_context(ctx_dir, ctx)
+        self._ctx_scans[ctx_dir] = (stat_key, toggles, skills)
+        return skills
+
+    def _rebuild(self) -> CatalogSnapshot:
+        # Stat before reading so a concurrent write is picked up on the next check
+        with _stats.stage("config_load"):
+            watched = {MASTER_CONFIG_PATH: _stat_key(MASTER_CONFIG_PATH)}
+            hub_name = _read_master_config().get("active_hub", "MySkillHub")
+            contexts_dir, skills_dir, config_path = _hub_paths_for(hub_name)
+
+            watched[config_path] = _stat_key(config_path)
+            watched[contexts_dir] = _stat_key(contexts_dir)
+            config = _load_config(config_path)
+
+        skills = []
+        for ctx in config.get("context_cells", []):
+            if ctx.get("enabled", True):
+                ctx_dir = contexts_dir / ctx.get("folder", "")
+                watched[ctx_dir] = _stat_key(ctx_dir)
+                skills.extend(self._scan_context_cached(ctx_dir, ctx, watched[ctx_dir]))
+        # Forget scans of contexts that were disabled, removed or on another hub
+        for ctx_dir in set(self._ctx_scans) - set(watched):
+            del self._ctx_scans[ctx_dir]
+
+        skills = tuple(skills)
+        by_name: Dict[str, Dict] = {}
+        for skill in skills:
+            by_name.setdefault(skill["name"], skill)
+
+        self._version += 1
+        self._watched = watched
+        self._snapshot = CatalogSnapshot(
+            version=self._version,
+            hub_name=hub_name,
+            contexts_dir=contexts_dir,
+            skills_dir=skills_dir,
+            config_path=config_path,
+            config=config,
+            skills=skills,
+            by_name=by_name,
+        )
+        logging.debug(
+            f"Catalog v{self._version} built for hub '{hub_name}': {len(skills)} skills"
+        )
+        return self._snapshot
+
+    def current(self) -> CatalogSnapshot:
+        """Return the current snapshot, rebuilding it first if anything changed."""
+        with _stats.stage("catalog"), self._lock:
+            if self._snapshot is not None and self._watcher_attached:
+                return self._snapshot
+            if self._is_stale():
+                return self._rebuild()
+            return self._snapshot
+
+    def refresh(self) -> bool:
+        """Rebuild if anything changed on disk; return True if the catalog changed."""
+        with self._lock:
+            if self._pinned or not self._is_stale():
+                return False
+            old = self._snapshot
+            new = self._rebuild()
+            if old is None:
+                return True
+            return (
+                old.hub_name != new.hub_name
+                or old.skills != new.skills
+                or old.config != new.config
+            )
+
+    def attach_watcher(self, attached: bool = True) -> None:
+        """Trust an external watcher to call refresh() instead of stat-checking per call."""
+        with self._lock:
+            self._watcher_attached = attached
+
+    def pin(self, snapshot: CatalogSnapshot) -> None:
+        """Serve a fixed snapshot from now on (used when serving a compiled pack)."""
+        with self._lock:
+            self._version += 1
+            self._snapshot = snapshot._replace(version=self._version)
+            self._watched = {}
+            self._pinned = True
+
 
+_catalog = SkillCatalog()
 
-def _get_skill_dir(name: str) -> pathlib.Path:
-    """Resolve a skill name to its directory path."""
+
+# Build the catalog at startup and log storage directory info and active hub
+contexts_dir, skills_dir, config_path = _get_active_hub_paths()
+logging.info(f"Storage dir: {STORAGE_DIR}")
+logging.info(f"Active hub: {_get_active_hub_name()}")
+logging.info(f"Contexts dir: {contexts_dir}")
+logging.info(f"Skills dir: {skills_dir}")
+
+
+def _get_enabled_skills() -> List[Dict]:
+    """
+    Get all enabled skills from enabled context cells only.
+    Returns list of dicts: {name, path, mode, type}
+    Served from the resident catalog; see SkillCatalog.
+    """
+    return list(_catalog.current().skills)
+
+
+def _get_skill_dir(
+    name: str, snapshot: Optional[CatalogSnapshot] = None
+) -> pathlib.Path:
+    """Resolve a skill name to its directory path (optionally within a given snapshot)."""
     name = name.strip().strip("'").strip('"')
     if not name:
         raise ValueError("Skill name cannot be empty")
@@ -172,10 +582,12 @@ def _get_skill_dir(name: str) -> pathlib.Path:
         raise ValueError(f"Invalid skill name: {name}")
 
     # Search in enabled skills
-    for skill in _get_enabled_skills():
-        if skill["name"] == name:
-            logging.debug(f"Resolved skill '{name}' to: {skill['path']}")
-            return skill["path"]
+    if snapshot is None:
+        snapshot = _catalog.current()
+    skill = snapshot.by_name.get(name)
+    if skill is not None:
+        logging.debug(f"Resolved skill '{name}' to: {skill['path']}")
+        return skill["path"]
 
     # Fallback: direct lookup in legacy path
     legacy_dir = LEGACY_SKILLS_DIR / name
@@ -183,83 +595,150 @@ def _get_skill_dir(name: str) -> pathlib.Path:
         return legacy_dir
 
     # Report error
-    enabled = [s["name"] for s in _get_enabled_skills()]
+    enabled = [s["name"] for s in snapshot.skills]
     logging.error(f"Skill not found: {name}. Available: {enabled}")
     raise ValueError(f"No skill folder found with name: {name}")
 
 
-def _get_discovery_description(skill_dir: pathlib.Path) -> str:
-    """Reads description from skill.md/SKILL.md frontmatter for the list_available_skills tool."""
-    import re
+_FRONTMATTER_RE = re.compile(r"^---\n([\s\S]*?)\n---")
+_FRONTMATTER_STRIP_RE = re.compile(r"^---\n[\s\S]*?\n---\n*")
+_DESCRIPTION_RE = re.compile(r"^description:\s*(.*)$", re.MULTILINE)
+_CLOSING_QUOTE_RE = {'"': re.compile(r'"\s*$'), "'": re.compile(r"'\s*$")}
 
-    skill_md_path = skill_dir / "skill.md"
-    if not skill_md_path.exists():
-        skill_md_path = skill_dir / "SKILL.md"
-    if not skill_md_path.exists():
-        return "No description provided."
-    try:
-        content = skill_md_path.read_text(encoding="utf-8")
-        frontmatter_match = re.match(r"^---\n([\s\S]*?)\n---", content)
-        if frontmatter_match:
-            frontmatter = frontmatter_match.group(1)
+NO_DESCRIPTION = "No description provided."
 
-            desc_line_match = re.search(
-                r"^description:\s*(.*)$", frontmatter, re.MULTILINE
-            )
-            if desc_line_match:
-                desc_value = desc_line_match.group(1).strip()
-
-                if desc_value.startswith('"'):
-                    remaining = frontmatter[desc_line_match.end() :]
-                    full_desc = desc_value[1:]
-
-                    end_match = re.search(r'"\s*$', full_desc)
-                    if end_match:
-                        full_desc = full_desc[: end_match.start()]
-                    else:
-                        for line in remaining.split("\n"):
-                            end_match = re.search(r'"\s*$', line)
-                            if end_match:
-                                full_desc += "\n" + line[: end_match.start()]
-                                break
-                            else:
-                                full_desc += "\n" + line
-
-                    full_desc = full_desc.replace('\\"', '"').replace("\\'", "'")
-                    return " ".join(full_desc.split())
-
-                elif desc_value.startswith("'"):
-                    remaining = frontmatter[desc_line_match.end() :]
-                    full_desc = desc_value[1:]
-
-                    end_match = re.search(r"'\s*$", full_desc)
-                    if end_match:
-                        full_desc = full_desc[: end_match.start()]
-                    else:
-                        for line in remaining.split("\n"):
-                            end_match = re.search(r"'\s*$", line)
-                            if end_match:
-                                full_desc += "\n" + line[: end_match.start()]
-                                break
-                            else:
-                                full_desc += "\n" + line
-
-                    full_desc = full_desc.replace('\\"', '"').replace("\\'", "'")
-                    return " ".join(full_desc.split())
 
-                else:
-                    return desc_value.strip()
+def _parse_description(content: str) -> str:
+    """Extract the (possibly quoted, multi-line) description from skill.md frontmatter."""
+    frontmatter_match = _FRONTMATTER_RE.match(content)
+    if not frontmatter_match:
+        return NO_DESCRIPTION
+    frontmatter = frontmatter_match.group(1)
+
+    desc_line_match = _DESCRIPTION_RE.search(frontmatter)
+    if not desc_line_match:
+        return NO_DESCRIPTION
+    desc_value = desc_line_match.group(1).strip()
+
+    quote = desc_value[:1]
+    if quote not in ('"', "'"):
+        return desc_value
+
+    # Quoted value: runs until the first line that ends with the same quote
+    closing_re = _CLOSING_QUOTE_RE[quote]
+    full_desc = desc_value[1:]
+    end_match = closing_re.search(full_desc)
+    if end_match:
+        full_desc = full_desc[: end_match.start()]
+    else:
+        for line in frontmatter[desc_line_match.end() :].split("\n"):
+            end_match = closing_re.search(line)
+            if end_match:
+                full_desc += "\n" + line[: end_match.start()]
+                break
+            full_desc += "\n" + line
+
+    full_desc = full_desc.replace('\\"', '"').replace("\\'", "'")
+    return " ".join(full_desc.split())
 
-        return "No description provided."
+
+def _find_skill_md(skill_dir: pathlib.Path) -> Optional[pathlib.Path]:
+    """Return skill.md (or SKILL.md) inside a skill folder, or None."""
+    skill_md = skill_dir / "skill.md"
+    if not skill_md.exists():
+        skill_md = skill_dir / "SKILL.md"
+    return skill_md if skill_md.exists() else None
+
+
+def _get_discovery_description(skill_dir: pathlib.Path) -> str:
+    """Reads description from skill.md/SKILL.md frontmatter for the list_available_skills tool."""
+    skill_md_path = _find_skill_md(skill_dir)
+    if skill_md_path is None:
+        return NO_DESCRIPTION
+    try:
+        return _parse_description(skill_md_path.read_text(encoding="utf-8"))
     except Exception:
         return "Error reading skill.md frontmatter"
 
 
+class DescriptionIndex:
+    """
+    Persistent per-hub index of skill.md descriptions.
+
+    Stored as <hub>/.mcp-cache/descriptions.json and keyed by skill.md path.
+    Each entry keeps the file's size and mtime_ns, so only skill.md files that
+    changed since the last listing are read and parsed again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[pathlib.Path] = None
+        self._entries: Dict[str, list] = {}
+
+    def _bind(self, hub_dir: pathlib.Path) -> None:
+        path = hub_dir / CACHE_DIR_NAME / "descriptions.json"
+        if path == self._path:
+            return
+        self._path = path
+        self._entries = {}
+        if path.exists():
+            try:
+                self._entries = json.loads(path.read_text(encoding="utf-8"))
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable description index {path}: {e}")
+
+    def describe(self, hub_dir: pathlib.Path, skill_dirs: List[pathlib.Path]) -> Dict:
+        """Return {skill_dir: description}, re-parsing only changed skill.md files."""
+        with _stats.stage("descriptions"), self._lock:
+            self._bind(hub_dir)
+            entries = {}
+            descriptions = {}
+            changed = False
+            for skill_dir in skill_dirs:
+                skill_md = _find_skill_md(skill_dir)
+                if skill_md is None:
+                    descriptions[skill_dir] = NO_DESCRIPTION
+                    continue
+                key = str(skill_md)
+                entry = self._entries.get(key)
+                try:
+                    st = skill_md.stat()
+                    if entry is None or entry[:2] != [st.st_size, st.st_mtime_ns]:
+                        content = skill_md.read_text(encoding="utf-8")
+                        _stats.record_read(st.st_size)
+                        entry = [
+                            st.st_size,
+                            st.st_mtime_ns,
+                            _parse_description(content),
+                        ]
+                        changed = True
+                except Exception:
+                    descriptions[skill_dir] = "Error reading skill.md frontmatter"
+                    continue
+                entries[key] = entry
+                descriptions[skill_dir] = entry[2]
+
+            if changed or entries.keys() != self._entries.keys():
+                self._entries = entries
+                self._save()
+            return descriptions
+
+    def _save(self) -> None:
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._entries), encoding="utf-8")
+            os.replace(tmp_path, self._path)
+        except Exception as e:
+            logging.warning(f"Could not write description index {self._path}: {e}")
+
+
+_description_index = DescriptionIndex()
+
+
 def _strip_frontmatter(content: str) -> str:
     """Strip YAML frontmatter from content if present."""
-    import re
-
-    return re.sub(r"^---\n[\s\S]*?\n---\n*", "", content)
+    return _FRONTMATTER_STRIP_RE.sub("", content)
 
 
 def _is_text_file(file_path: pathlib.Path) -> bool:
@@ -277,194 +756,3609 @@ def _is_text_file(file_path: pathlib.Path) -> bool:
         return False
 
 
+def _format_file(relative: str, content: Optional[str], is_text: bool = True) -> str:
+    """Format one file for the context window (content None means a read error)."""
+    if not is_text:
+        return f"### Binary/Non-Text File: {relative}\n[Non-text file. View manually if needed.]\n"
+    if content is None:
+        return f"### File: {relative} (Error reading)\n"
+    return f"### File: {relative}\n\n{content}\n"
+
+
+def _format_skill_md(content: Optional[str]) -> str:
+    """Format the skill.md body (content None means a read error)."""
+    if content is None:
+        return "# Main Skill File: skill.md (Error reading)\n"
+    return f"# Main Skill File: skill.md\n\n{_strip_frontmatter(content)}\n"
+
+
 def _read_file_safe(file_path: pathlib.Path, skill_dir: pathlib.Path) -> str:
     """Helper to format file content for the context window."""
     relative = file_path.relative_to(skill_dir).as_posix()
     if not _is_text_file(file_path):
-        return f"### Binary/Non-Text File: {relative}\n[Non-text file. View manually if needed.]\n"
+        return _format_file(relative, None, is_text=False)
     try:
-        content = file_path.read_text(encoding="utf-8")
-        return f"### File: {relative}\n\n{content}\n"
+        return _format_file(relative, file_path.read_text(encoding="utf-8"))
     except Exception:
-        return f"### File: {relative} (Error reading)\n"
+        return _format_file(relative, None)
 
 
-@mcp.tool
-def list_available_skills() -> List[Dict]:
+def _collect_skill_files(skill_dir: pathlib.Path) -> tuple:
     """
-    List available skills to help decide which one to use.
-    Only returns skills that the user has explicitly enabled.
-    Skills marked as 'always_loaded' are auto-loaded into context.
-    Skills marked as 'dynamic' are listed here for on-demand loading.
-
-    Usage:
-    Call this tool to discover what skills are available.
-    Example: list_available_skills()
+    Return (skill_md, root_files, sub_files) in context load order.
+    skill_md is skill.md/SKILL.md or None; root files and subfolder files are
+    sorted alphabetically and exclude skill.md and description.md.
     """
-    items = []
-    for skill in _get_enabled_skills():
-        items.append(
-            {
-                "name": skill["name"],
-                "description": _get_discovery_description(skill["path"]),
-                "mode": skill["mode"],
-                "type": skill["type"],
-            }
-        )
-    return sorted(items, key=lambda x: x["name"])
+    skill_md = _find_skill_md(skill_dir)
 
+    root_files = []
+    root_subdirs = []
+    for entry in skill_dir.iterdir():
+        if entry.is_dir():
+            root_subdirs.append(entry)
+        elif entry.is_file() and entry.name.lower() not in (
+            "skill.md",
+            "description.md",
+        ):
+            root_files.append(entry)
 
-@mcp.tool
-def get_default_skills() -> str:
-    """
-    Load all skills marked as 'default' mode. These skills should
-    ALWAYS be loaded into the AI context at the start of every conversation.
+    sub_files = []
+    for subdir in sorted(root_subdirs):
+        for f in sorted(f for f in subdir.rglob("*") if f.is_file()):
+            if f.name.lower() == "description.md":
+                continue
+            sub_files.append(f)
 
-    Usage:
-    Call this tool at the beginning of every session to load default skills.
-    Example: get_default_skills()
-    """
-    parts = []
-    always_loaded_skills = [
-        s for s in _get_enabled_skills() if s["mode"] == "always_loaded"
-    ]
+    return skill_md, sorted(root_files), sub_files
 
-    if not always_loaded_skills:
-        return "No always_loaded skills configured."
 
-    for skill in always_loaded_skills:
-        skill_dir = skill["path"]
-        context_parts = [f"<<START skill {skill['name']}>>\n"]
+def _version_hash(*parts) -> str:
+    """Short stable hash used as an ETag-style content version."""
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8"))
+    return digest.hexdigest()[:16]
 
-        # 1. Load skill.md/SKILL.md (strip frontmatter)
-        skill_md = skill_dir / "skill.md"
-        if not skill_md.exists():
-            skill_md = skill_dir / "SKILL.md"
-        if skill_md.exists():
-            try:
-                content = skill_md.read_text(encoding="utf-8")
-                content = _strip_frontmatter(content)
-                context_parts.append(f"# Main Skill File: skill.md\n\n{content}\n")
-            except Exception:
-                context_parts.append("# Main Skill File: skill.md (Error reading)\n")
-
-        # 2. Root files
-        root_files = sorted(
-            [
-                f
-                for f in skill_dir.iterdir()
-                if f.is_file() and f.name.lower() not in ("skill.md", "description.md")
-            ]
-        )
-        if root_files:
-            context_parts.append("\n# --- Additional Root Files ---\n")
-            for f in root_files:
-                context_parts.append(_read_file_safe(f, skill_dir))
-
-        # 3. Subfolders
-        root_subdirs = sorted([d for d in skill_dir.iterdir() if d.is_dir()])
-        if root_subdirs:
-            context_parts.append("\n# --- Subfolder Resources ---\n")
-            for subdir in root_subdirs:
-                sub_files = sorted([f for f in subdir.rglob("*") if f.is_file()])
-                for f in sub_files:
-                    if f.name == "description.md":
-                        continue
-                    context_parts.append(_read_file_safe(f, skill_dir))
 
-        context_parts.append(f"<< END skill {skill['name']}>>\n")
-        parts.append("\n".join(context_parts))
+def _with_version(text: str, version: str) -> str:
+    """Append the version trailer that clients echo back as if_none_match."""
+    return f"{text}\n<<VERSION {version}>>"
 
-    return "\n\n".join(parts)
 
+def _unchanged_marker(version: str) -> str:
+    return (
+        f"<<UNCHANGED {version}>> Content is identical to the version you already have."
+    )
 
-@mcp.tool
-def load_full_skill_context(name: str) -> str:
-    """
-    Load the skill context.
-    Order: 1. skill.md (body only, frontmatter excluded) -> 2. Root files (A-Z) -> 3. Subfolders (A-Z).
-    Excludes: description.md (legacy), frontmatter from skill.md
-    Wraps content in <<START skill>> ... << END skill>>.
 
-    Usage:
-    Call this tool to load the full content of a skill into the context.
-    Example: load_full_skill_context(name="python-expert")
-    """
-    skill_dir = _get_skill_dir(name)
+def _estimate_tokens(text: str) -> int:
+    """Approximate token count (4 chars = 1 token, same heuristic as the web UI)."""
+    return (len(text) + 3) // 4
 
-    context_parts = [f"<<START skill {name}>>\n"]
 
-    # 1. Load skill.md/SKILL.md (strip frontmatter)
-    skill_md = skill_dir / "skill.md"
-    if not skill_md.exists():
-        skill_md = skill_dir / "SKILL.md"
-    if skill_md.exists():
-        try:
-            content = skill_md.read_text(encoding="utf-8")
-            content = _strip_frontmatter(content)
-            context_parts.append(f"# Main Skill File: skill.md\n\n{content}\n")
-        except Exception:
-            context_parts.append(f"# Main Skill File: skill.md (Error reading)\n")
-    else:
-        context_parts.append(f"# Main Skill File: skill.md (Missing)\n")
+class FileBlock(NamedTuple):
+    """One rendered file of a skill context with its token estimate."""
 
-    # 2. Root Files (Alphabetical)
-    root_files = sorted(
-        [
-            f
-            for f in skill_dir.iterdir()
-            if f.is_file() and f.name.lower() not in ("skill.md", "description.md")
-        ]
-    )
-    if root_files:
-        context_parts.append("\n# --- Additional Root Files ---\n")
-        for f in root_files:
-            context_parts.append(_read_file_safe(f, skill_dir))
+    relative: str
+    text: str
+    tokens: int
+    digest: str = ""  # SHA-1 of the file on disk, for de-duplication
 
-    # 3. Subfolder Files (Alphabetical)
-    root_subdirs = sorted([d for d in skill_dir.iterdir() if d.is_dir()])
-    if root_subdirs:
-        context_parts.append("\n# --- Subfolder Resources ---\n")
-        for subdir in root_subdirs:
-            sub_files = sorted([f for f in subdir.rglob("*") if f.is_file()])
-            for f in sub_files:
-                if f.name.lower() == "description.md":
-                    continue
-                context_parts.append(_read_file_safe(f, skill_dir))
 
-    context_parts.append(f"<< END skill {name}>>")
-    return "\n".join(context_parts)
+class SkillContent(NamedTuple):
+    """Rendered file blocks of one skill in context load order."""
 
+    skill_md: Optional[FileBlock]
+    root: tuple
+    sub: tuple
+    size: int
+    version: str
 
-def _list_skill_files_internal(name: str) -> List[str]:
-    """Internal helper: List all files in a skill folder."""
-    skill_dir = _get_skill_dir(name)
-    files = []
-    for file_path in sorted(skill_dir.rglob("*")):
-        if file_path.is_file() and file_path.name.lower() != "description.md":
-            relative = file_path.relative_to(skill_dir).as_posix()
-            files.append(relative)
-    return files
 
+class ManifestEntry(NamedTuple):
+    """One file of a skill as recorded in its manifest."""
 
-def _load_skill_file_internal(name: str, relative_path: str) -> str:
-    """Internal helper: Load a specific file from a skill."""
-    skill_dir = _get_skill_dir(name)
-    file_path = (skill_dir / relative_path).resolve()
+    path: str  # relative POSIX path
+    role: str  # "skill_md", "root" or "sub"
+    is_text: bool
+    size: int
+    mtime_ns: int
+    ino: int
+    sha1: str
+    tokens: int  # estimate for the rendered file block
 
-    if not str(file_path).startswith(str(skill_dir)):
-        raise ValueError("Invalid path")
 
-    if not file_path.exists():
-        raise ValueError(f"File not found: {relative_path}")
+class SkillManifest(NamedTuple):
+    """Every file of a skill in context load order, plus its directory stat keys."""
 
-    if file_path.name == "description.md":
-        return "Error: description.md is a legacy metadata file and cannot be loaded directly."
+    dirs: tuple  # ((relative dir, stat key), ...), "" is the skill folder
+    files: tuple  # ManifestEntry, ...
+    version: str  # hash over (path, sha1) of all files
 
-    if file_path.name.lower() == "skill.md":
-        try:
-            content = file_path.read_text(encoding="utf-8")
-            content = _strip_frontmatter(content)
+
+def _classify_bytes(path: pathlib.Path, data: bytes, role: str) -> tuple:
+    """
+    Decode file bytes once, classifying them the way _is_text_file plus
+    read_text would. Returns (text, is_text); text is None for a binary file
+    and for a text file that cannot be decoded.
+    """
+    if role != "skill_md":
+        mime, _ = mimetypes.guess_type(path)
+        if mime and mime.startswith(
+            ("image/", "video/", "audio/", "application/octet-stream")
+        ):
+            return None, False
+    try:
+        return _decode_text(data), True
+    except UnicodeDecodeError as e:
+        # _is_text_file only sniffs the first 512 characters
+        if role == "skill_md" or len(data[: e.start].decode("utf-8")) >= 512:
+            return None, True
+        return None, False
+
+
+def _skill_cache_dir(skill_dir: pathlib.Path) -> Optional[pathlib.Path]:
+    """The .mcp-cache folder of the hub a skill lives in, None outside a hub."""
+    contexts_dir = skill_dir.parent.parent
+    if contexts_dir.name != "contexts" or contexts_dir.parent.parent != HUBS_BASE_DIR:
+        return None
+    return contexts_dir.parent / CACHE_DIR_NAME
+
+
+def _render_manifest_file(entry_path: str, role: str, text: Optional[str]) -> str:
+    if role == "skill_md":
+        return _format_skill_md(text)
+    return _format_file(entry_path, text)
+
+
+class ManifestIndex:
+    """
+    Per-skill manifests: text/binary class, size, mtime, SHA-1 and token
+    estimate of every file, in context load order.
+
+    Each manifest is kept in memory and persisted as a lock file under
+    <hub>/.mcp-cache/skill-locks/<context>/<skill>.lock. It also records the
+    stat keys of the skill's directories: while none of them changed, the file
+    set is unchanged and a refresh is one stat() per file, with no directory
+    walk. Only files whose (inode, size, mtime_ns) changed are read again, and
+    their bytes are handed to the caller so nothing is opened twice.
+    """
+
+    # Bumped when the meaning of a field changes; older lock files are rebuilt
+    FORMAT = 2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifests: Dict[str, SkillManifest] = {}
+        self.rebuilt_files = 0
+
+    @staticmethod
+    def _lock_path(skill_dir: pathlib.Path) -> Optional[pathlib.Path]:
+        cache_dir = _skill_cache_dir(skill_dir)
+        if cache_dir is None:
+            return None  # not in a hub: keep the manifest in memory only
+        return (
+            cache_dir / "skill-locks" / skill_dir.parent.name / f"{skill_dir.name}.lock"
+        )
+
+    def _load(self, skill_dir: pathlib.Path) -> Optional[SkillManifest]:
+        path = self._lock_path(skill_dir)
+        if path is None or not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("format") != self.FORMAT:
+                return None
+            return SkillManifest(
+                tuple((d, tuple(k) if k else None) for d, k in data["dirs"]),
+                tuple(ManifestEntry(*f) for f in data["files"]),
+                data["version"],
+            )
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable skill manifest {path}: {e}")
+            return None
+
+    def _save(self, skill_dir: pathlib.Path, manifest: SkillManifest) -> None:
+        path = self._lock_path(skill_dir)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            data = {"format": self.FORMAT, **manifest._asdict()}
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not write skill manifest {path}: {e}")
+
+    @staticmethod
+    def _walk(skill_dir: pathlib.Path) -> tuple:
+        """Return (dirs, [(role, path)]) in context load order."""
+        skill_md, root_files, sub_files = _collect_skill_files(skill_dir)
+        dirs = [("", _stat_key(skill_dir))]
+        for d in sorted(p for p in skill_dir.rglob("*") if p.is_dir()):
+            dirs.append((d.relative_to(skill_dir).as_posix(), _stat_key(d)))
+        files = [("skill_md", skill_md)] if skill_md else []
+        files += [("root", f) for f in root_files] + [("sub", f) for f in sub_files]
+        return tuple(dirs), files
+
+    @staticmethod
+    def _read_entry(
+        role: str, path: pathlib.Path, relative: str, st: os.stat_result
+    ) -> Optional[tuple]:
+        """Read one changed file: (ManifestEntry, decoded text), None if gone."""
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        _stats.record_read(len(data))
+        text, is_text = _classify_bytes(path, data, role)
+        rendered = (
+            _render_manifest_file(relative, role, text)
+            if is_text
+            else _format_file(relative, None, is_text=False)
+        )
+        entry = ManifestEntry(
+            relative,
+            role,
+            is_text,
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_ino,
+            hashlib.sha1(data).hexdigest(),
+            _estimate_tokens(rendered),
+        )
+        return entry, text
+
+    def manifest(self, skill_dir: pathlib.Path) -> tuple:
+        """
+        Return (manifest, fresh) for a skill, where fresh maps the relative
+        path of every file read during this refresh to its decoded text.
+        """
+        return self.manifests([skill_dir])[0]
+
+    def manifests(self, skill_dirs: List[pathlib.Path]) -> List[tuple]:
+        """
+        manifest() for several skills: the changed files of all of them are
+        read in one batch on the shared I/O pool.
+        """
+        plans = [self._plan(skill_dir) for skill_dir in skill_dirs]
+        jobs = [job for plan in plans for job in plan[3].values()]
+        read = _stats.bind(lambda args: self._read_entry(*args))
+        if len(jobs) > 1:
+            results = iter(list(_io_pool.map(read, jobs)))
+        else:
+            results = map(read, jobs)
+        return [
+            self._commit(skill_dir, plan, [next(results) for _ in plan[3]])
+            for skill_dir, plan in zip(skill_dirs, plans)
+        ]
+
+    def _plan(self, skill_dir: pathlib.Path) -> tuple:
+        """Stat a skill's files: (cached, dirs, entries, stale read jobs by index)."""
+        key = str(skill_dir)
+        with self._lock:
+            cached = self._manifests.get(key)
+        if cached is None:
+            cached = self._load(skill_dir)
+
+        if cached is not None and all(
+            _stat_key(skill_dir / d if d else skill_dir) == k for d, k in cached.dirs
+        ):
+            dirs = cached.dirs
+            files = [(e.role, skill_dir / e.path) for e in cached.files]
+        else:
+            dirs, files = self._walk(skill_dir)
+
+        old = {e.path: e for e in cached.files} if cached is not None else {}
+        entries, stale = [], {}
+        for role, path in files:
+            relative = path.relative_to(skill_dir).as_posix()
+            try:
+                st = path.stat()
+            except OSError:
+                continue  # removed while we were looking
+            entry = old.get(relative)
+            if entry is None or (entry.role, entry.ino, entry.size, entry.mtime_ns) != (
+                role,
+                st.st_ino,
+                st.st_size,
+                st.st_mtime_ns,
+            ):
+                stale[len(entries)] = (role, path, relative, st)
+                entry = None
+            entries.append(entry)
+        return cached, dirs, entries, stale
+
+    def _commit(self, skill_dir: pathlib.Path, plan: tuple, results: List) -> tuple:
+        """Fill in the re-read entries of a plan and store the new manifest."""
+        cached, dirs, entries, stale = plan
+        fresh = {}
+        for index, result in zip(stale, results):
+            if result is not None:
+                entries[index], fresh[result[0].path] = result
+                self.rebuilt_files += 1
+        entries = [e for e in entries if e is not None]
+
+        version = _version_hash(*(f"{e.path}:{e.sha1}" for e in entries))
+        manifest = SkillManifest(dirs, tuple(entries), version)
+        if cached is None or manifest != cached:
+            self._save(skill_dir, manifest)
+        with self._lock:
+            self._manifests[str(skill_dir)] = manifest
+        return manifest, fresh
+
+
+_manifests = ManifestIndex()
+
+
+def _file_block(relative: str, text: str, digest: str = "") -> FileBlock:
+    return FileBlock(relative, text, _estimate_tokens(text), digest)
+
+
+def _render_entry(
+    entry: ManifestEntry, fresh: Dict[str, Optional[str]], skill_dir: pathlib.Path
+) -> FileBlock:
+    """Render one manifest file, reading it unless the manifest refresh just did."""
+    if not entry.is_text:
+        text = _format_file(entry.path, None, is_text=False)
+        return FileBlock(entry.path, text, entry.tokens, entry.sha1)
+    if entry.path in fresh:
+        content = fresh[entry.path]
+    else:
+        try:
+            data = (skill_dir / entry.path).read_bytes()
+            _stats.record_read(len(data))
+            content = _decode_text(data)
+        except (OSError, UnicodeDecodeError):
+            content = None
+    return _file_block(
+        entry.path,
+        _render_manifest_file(entry.path, entry.role, content),
+        entry.sha1,
+    )
+
+
+def _build_skill_content(
+    manifest: SkillManifest, fresh: Dict[str, Optional[str]], skill_dir: pathlib.Path
+) -> SkillContent:
+    """Render every file of a skill (skill.md body, root files, subfolders)."""
+    # Files not read by the manifest refresh are read concurrently on the shared I/O pool
+    render = _stats.bind(lambda entry: _render_entry(entry, fresh, skill_dir))
+    return _assemble_skill_content(manifest, list(_io_pool.map(render, manifest.files)))
+
+
+def _assemble_skill_content(
+    manifest: SkillManifest, blocks: List[FileBlock]
+) -> SkillContent:
+    """Group the rendered blocks of a skill's files (in manifest order) by role."""
+    md_block = None
+    if blocks and manifest.files[0].role == "skill_md":
+        md_block = blocks.pop(0)
+    roles = [e.role for e in manifest.files if e.role != "skill_md"]
+    root = tuple(b for b, role in zip(blocks, roles) if role == "root")
+    sub = tuple(b for b, role in zip(blocks, roles) if role == "sub")
+    all_blocks = ((md_block,) if md_block else ()) + root + sub
+    size = sum(len(block.text.encode("utf-8")) for block in all_blocks)
+    return SkillContent(md_block, root, sub, size, manifest.version)
+
+
+def _duplicate_reference(relative: str, origin: str) -> str:
+    return f"### File: {relative}\n[Identical to {origin} above; not repeated.]\n"
+
+
+# Token cost of a reference to an already emitted identical file
+DUPLICATE_REF_TOKENS = _estimate_tokens(_duplicate_reference("x" * 24, "x" * 48))
+
+
+# Near-duplicate paragraphs: MinHash over word shingles, bucketed by LSH bands.
+# 16 bands of 4 rows make pairs above ~0.5 Jaccard candidates; candidates are
+# then confirmed against NEAR_DUP_THRESHOLD on the full signature.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_WORDS = 3
+NEAR_DUP_THRESHOLD = 0.8
+NEAR_DUP_MIN_WORDS = 25  # shorter paragraphs cost less than the reference to them
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_COEFFS = [
+    (rng.randrange(1, _MINHASH_PRIME), rng.randrange(_MINHASH_PRIME))
+    for rng in [random.Random(0x5D1C)]
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+_PARAGRAPH_FENCE_RE = re.compile(r"^[ \t]*(```|~~~)")
+
+
+def _paragraph_spans(text: str) -> List[tuple]:
+    """
+    Split markdown into (start, end) paragraph spans: blocks separated by
+    blank lines, with fenced code kept whole and headings on their own.
+    """
+    spans = []
+    start = None
+    fence = None
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        end = pos + len(line)
+        stripped = line.strip()
+        match = _PARAGRAPH_FENCE_RE.match(line)
+        if fence is not None:
+            if match and match.group(1) == fence:
+                fence = None
+        elif match:
+            fence = match.group(1)
+            if start is None:
+                start = pos
+        elif not stripped or stripped.startswith("#"):
+            if start is not None:
+                spans.append((start, pos))
+                start = None
+            if stripped:
+                spans.append((pos, end))
+        elif start is None:
+            start = pos
+        pos = end
+    if start is not None:
+        spans.append((start, pos))
+    return spans
+
+
+def _minhash(words: List[str]) -> array.array:
+    shingles = {
+        zlib.crc32(" ".join(words[i : i + SHINGLE_WORDS]).encode("utf-8"))
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+    return array.array(
+        "Q",
+        (
+            min([(a * h + b) % _MINHASH_PRIME for h in shingles])
+            for a, b in _MINHASH_COEFFS
+        ),
+    )
+
+
+def _similarity(a: array.array, b: array.array) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_PERMUTATIONS
+
+
+def _band_keys(signature: array.array) -> List[tuple]:
+    return [
+        (band, signature[band * LSH_ROWS : (band + 1) * LSH_ROWS].tobytes())
+        for band in range(LSH_BANDS)
+    ]
+
+
+class Paragraph(NamedTuple):
+    """A paragraph of a rendered file block long enough to be de-duplicated."""
+
+    start: int
+    end: int
+    tokens: int
+    signature: array.array
+
+
+class ParagraphIndex:
+    """
+    MinHash signatures of the long paragraphs of rendered file blocks.
+
+    Keyed by file SHA-1 and path, so entries never go stale: an edited file
+    has a new key and the old entry ages out of the LRU.
+    """
+
+    MAX_BLOCKS = 8192
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def paragraphs(self, block: FileBlock) -> tuple:
+        key = f"{block.digest}:{block.relative}"
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+        paragraphs = []
+        for start, end in _paragraph_spans(block.text):
+            words = _tokenize(block.text[start:end])
+            if len(words) >= NEAR_DUP_MIN_WORDS:
+                tokens = _estimate_tokens(block.text[start:end])
+                paragraphs.append(Paragraph(start, end, tokens, _minhash(words)))
+        paragraphs = tuple(paragraphs)
+        if block.digest:
+            with self._lock:
+                self._entries[key] = paragraphs
+                while len(self._entries) > self.MAX_BLOCKS:
+                    self._entries.popitem(last=False)
+        return paragraphs
+
+
+_paragraphs = ParagraphIndex()
+
+
+def _near_duplicate_reference(origin: str) -> str:
+    return f"[Near-duplicate of a paragraph in {origin}; omitted.]\n"
+
+
+class NearDuplicateFilter:
+    """
+    Drops paragraphs that nearly repeat one already emitted in the same
+    response (dedupe="near"), leaving a one-line reference to the original.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: Dict[tuple, List[tuple]] = defaultdict(list)
+
+    def _match(self, signature: array.array, keys: List[tuple]) -> Optional[str]:
+        checked = set()
+        for key in keys:
+            for other, origin in self._buckets.get(key, ()):
+                if id(other) in checked:
+                    continue
+                checked.add(id(other))
+                if _similarity(signature, other) >= self.threshold:
+                    return origin
+        return None
+
+    def apply(self, label: str, block: FileBlock) -> str:
+        text = block.text
+        pieces = []
+        pos = 0
+        for paragraph in _paragraphs.paragraphs(block):
+            keys = _band_keys(paragraph.signature)
+            origin = self._match(paragraph.signature, keys)
+            if origin is None:
+                for key in keys:
+                    self._buckets[key].append((paragraph.signature, label))
+                continue
+            pieces.append(text[pos : paragraph.start])
+            pieces.append(_near_duplicate_reference(origin))
+            pos = paragraph.end
+        if not pieces:
+            return text
+        pieces.append(text[pos:])
+        return "".join(pieces)
+
+
+def _skill_parts(
+    name: str,
+    content: SkillContent,
+    mark_missing: bool = True,
+    included: Optional[set] = None,
+    seen: Optional[Dict[str, str]] = None,
+    near: Optional[NearDuplicateFilter] = None,
+) -> Iterator[str]:
+    """
+    Yield the <<START skill>> ... << END skill>> text for one skill in pieces.
+    If `included` is given, only those files are emitted and the rest are
+    listed in an omitted-files manifest. If `seen` is given (content digest ->
+    "skill/path", shared across the skills of one response), a file identical
+    to one already emitted is replaced by a short reference to it, and `near`
+    additionally drops paragraphs that nearly repeat earlier ones. The pieces
+    reference the cached file blocks, so nothing is copied until a page of the
+    response is assembled.
+    """
+    omitted = []
+
+    def keep(block: FileBlock) -> bool:
+        if included is None or block.relative in included:
+            return True
+        omitted.append(block)
+        return False
+
+    def emit(block: FileBlock) -> str:
+        if seen is None or not block.digest or block.tokens <= DUPLICATE_REF_TOKENS:
+            return block.text
+        label = f"{name}/{block.relative}"
+        origin = seen.setdefault(block.digest, label)
+        if origin != label:
+            return _duplicate_reference(block.relative, origin)
+        if near is not None:
+            return near.apply(label, block)
+        return block.text
+
+    context_parts = [f"<<START skill {name}>>\n"]
+
+    # 1. skill.md/SKILL.md body (frontmatter stripped)
+    if content.skill_md is not None:
+        if keep(content.skill_md):
+            context_parts.append(emit(content.skill_md))
+    elif mark_missing:
+        context_parts.append("# Main Skill File: skill.md (Missing)\n")
+
+    # 2. Root Files (Alphabetical)
+    root = [block for block in content.root if keep(block)]
+    if root:
+        context_parts.append("\n# --- Additional Root Files ---\n")
+        context_parts.extend(emit(block) for block in root)
+
+    # 3. Subfolder Files (Alphabetical)
+    sub = [block for block in content.sub if keep(block)]
+    if sub:
+        context_parts.append("\n# --- Subfolder Resources ---\n")
+        context_parts.extend(emit(block) for block in sub)
+
+    if omitted:
+        context_parts.append("\n# --- Omitted Files (over max_tokens budget) ---\n")
+        context_parts.append(
+            "\n".join(f"- {b.relative} (~{b.tokens} tokens)" for b in omitted) + "\n"
+        )
+
+    context_parts.append(f"<< END skill {name}>>")
+    for idx, part in enumerate(context_parts):
+        if idx:
+            yield "\n"
+        yield part
+
+
+# Rough token cost of the START/END wrapper and section headers of one skill
+SKILL_WRAPPER_TOKENS = 40
+
+
+def _select_within_budget(
+    contents: List[SkillContent], max_tokens: int, dedupe: bool = False
+) -> List[set]:
+    """
+    Greedily choose files to fit max_tokens, in priority order across all
+    skills: skill.md bodies first, then root files, then subfolder files.
+    With dedupe, copies of an already chosen file only cost a reference.
+    Returns one set of included file names per skill.
+    """
+    used = SKILL_WRAPPER_TOKENS * len(contents)
+    included = [set() for _ in contents]
+    chosen = set()
+    tiers = (
+        lambda c: (c.skill_md,) if c.skill_md else (),
+        lambda c: c.root,
+        lambda c: c.sub,
+    )
+    for tier in tiers:
+        for idx, content in enumerate(contents):
+            for block in tier(content):
+                cost = block.tokens
+                if dedupe and block.digest in chosen:
+                    cost = min(cost, DUPLICATE_REF_TOKENS)
+                if used + cost <= max_tokens:
+                    included[idx].add(block.relative)
+                    chosen.add(block.digest)
+                    used += cost
+    return included
+
+
+class ContextCache:
+    """
+    LRU cache of rendered skill contents bounded by total text size.
+
+    Entries are keyed by skill folder and validated against the skill's
+    manifest version (a hash over every file's path and SHA-1), so a repeat
+    load of an unchanged skill is a dictionary lookup and any edit misses.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, fingerprint: str) -> Optional[SkillContent]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != fingerprint:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, fingerprint: str, content: SkillContent) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1].size
+            if content.size > self.max_bytes:
+                return
+            self._entries[key] = (fingerprint, content)
+            self._bytes += content.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1].size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_context_cache = ContextCache(CONTEXT_CACHE_MAX_BYTES)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution: callers
+    that arrive while a call is in flight wait for it and share its result
+    (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], object]):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+_skill_loads = SingleFlight()
+
+
+def _load_skill_content(skill_dir: pathlib.Path) -> SkillContent:
+    """
+    Return the rendered content of a skill, served from the cache when
+    unchanged. Parallel loads of the same skill share one manifest refresh
+    and read.
+    """
+    if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+        return _hub_pack.skill_content(skill_dir)
+    return _skill_loads.do(str(skill_dir), lambda: _read_skill_content(skill_dir))
+
+
+def _read_skill_content(skill_dir: pathlib.Path) -> SkillContent:
+    with _stats.stage("file_read"):
+        manifest, fresh = _manifests.manifest(skill_dir)
+    key = str(skill_dir)
+
+    cached = _context_cache.get(key, manifest.version)
+    if cached is not None:
+        logging.debug(f"Context cache hit: {skill_dir.name}")
+        return cached
+
+    with _stats.stage("file_read"):
+        content = _build_skill_content(manifest, fresh, skill_dir)
+    _context_cache.put(key, manifest.version, content)
+    return content
+
+
+def _load_skill_contents(skill_dirs: List[pathlib.Path]) -> List[SkillContent]:
+    """
+    _load_skill_content for several skills: the manifests are refreshed
+    together and the files of every skill missing from the cache are read in
+    one batch on the shared I/O pool, instead of one skill after the other.
+    """
+    contents: Dict[str, SkillContent] = {}
+    folders = []
+    for skill_dir in dict.fromkeys(skill_dirs):
+        if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+            contents[str(skill_dir)] = _hub_pack.skill_content(skill_dir)
+        else:
+            folders.append(skill_dir)
+
+    with _stats.stage("file_read"):
+        manifests = _manifests.manifests(folders)
+    misses = []
+    for skill_dir, (manifest, fresh) in zip(folders, manifests):
+        cached = _context_cache.get(str(skill_dir), manifest.version)
+        if cached is not None:
+            contents[str(skill_dir)] = cached
+        else:
+            misses.append((skill_dir, manifest, fresh))
+
+    if misses:
+        with _stats.stage("file_read"):
+            jobs = [
+                (entry, fresh, skill_dir)
+                for skill_dir, manifest, fresh in misses
+                for entry in manifest.files
+            ]
+            render = _stats.bind(lambda job: _render_entry(*job))
+            blocks = iter(list(_io_pool.map(render, jobs)))
+            for skill_dir, manifest, _ in misses:
+                content = _assemble_skill_content(
+                    manifest, [next(blocks) for _ in manifest.files]
+                )
+                _context_cache.put(str(skill_dir), manifest.version, content)
+                contents[str(skill_dir)] = content
+    return [contents[str(skill_dir)] for skill_dir in skill_dirs]
+
+
+# Extractive digests: headings, the TextRank-top sentences and bullets and the
+# first code example of each section, capped at DIGEST_RATIO of the file's
+# tokens (or DIGEST_MIN_TOKENS for small files).
+DIGEST_RATIO = 0.12
+DIGEST_MIN_TOKENS = 64
+DIGEST_CODE_LINES = 8
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 30
+MARKDOWN_SUFFIXES = (".md", ".markdown", ".mdx")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9`*_\[(])")
+_BULLET_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+
+
+def _markdown_sections(text: str) -> List[Dict]:
+    """
+    Split markdown into sections [{"heading", "items"}]. Items are
+    ("code", text) for the first fenced block of the section and
+    ("bullet" | "sentence", text, paragraph id) for rankable units.
+    """
+    sections = [{"heading": None, "items": [], "code": False}]
+    paragraph: List[str] = []
+    fence = None
+    code: List[str] = []
+    para_id = 0
+
+    def flush() -> None:
+        nonlocal para_id
+        if paragraph:
+            prose = " ".join(line.strip() for line in paragraph)
+            for sentence in _SENTENCE_SPLIT_RE.split(prose):
+                sections[-1]["items"].append(("sentence", sentence, para_id))
+            paragraph.clear()
+        para_id += 1
+
+    for line in text.splitlines():
+        match = _PARAGRAPH_FENCE_RE.match(line)
+        if fence is not None:
+            code.append(line)
+            if match and match.group(1) == fence:
+                fence = None
+                section = sections[-1]
+                if not section["code"]:
+                    section["code"] = True
+                    if len(code) > DIGEST_CODE_LINES + 2:
+                        code = code[: DIGEST_CODE_LINES + 1] + ["...", code[-1]]
+                    section["items"].append(("code", "\n".join(code)))
+            continue
+        if match:
+            flush()
+            fence = match.group(1)
+            code = [line]
+        elif line.lstrip().startswith("#"):
+            flush()
+            sections.append({"heading": line.strip(), "items": [], "code": False})
+        elif not line.strip() or line.lstrip().startswith("|"):
+            flush()
+        elif _BULLET_RE.match(line):
+            flush()
+            sections[-1]["items"].append(("bullet", line.rstrip(), para_id))
+        elif not paragraph and sections[-1]["items"] and line.startswith(" "):
+            kind, item, pid = sections[-1]["items"][-1]
+            if kind == "bullet":
+                sections[-1]["items"][-1] = (kind, f"{item} {line.strip()}", pid)
+            else:
+                paragraph.append(line)
+        else:
+            paragraph.append(line)
+    flush()
+    return sections
+
+
+def _textrank(units: List[str]) -> List[float]:
+    """TextRank scores: PageRank over word-overlap similarity of the units."""
+    words = [set(_tokenize(unit)) for unit in units]
+    postings: Dict[str, List[int]] = defaultdict(list)
+    for idx, bag in enumerate(words):
+        for word in bag:
+            postings[word].append(idx)
+    edges: List[Dict[int, float]] = [dict() for _ in units]
+    for idx, bag in enumerate(words):
+        if len(bag) < 2:
+            continue
+        common: Dict[int, int] = defaultdict(int)
+        for word in bag:
+            for other in postings[word]:
+                if other > idx:
+                    common[other] += 1
+        for other, shared in common.items():
+            if len(words[other]) < 2:
+                continue
+            weight = shared / (math.log(len(bag)) + math.log(len(words[other])))
+            edges[idx][other] = edges[other][idx] = weight
+
+    totals = [sum(e.values()) for e in edges]
+    scores = [1.0] * len(units)
+    for _ in range(TEXTRANK_ITERATIONS):
+        scores = [
+            (1 - TEXTRANK_DAMPING)
+            + TEXTRANK_DAMPING
+            * sum(w * scores[j] / totals[j] for j, w in edges[i].items())
+            for i in range(len(units))
+        ]
+    return scores
+
+
+def _digest_markdown(text: str, ratio: float = DIGEST_RATIO) -> str:
+    """
+    Extractive digest of a markdown document (frontmatter removed), at most
+    ratio of its tokens. Headings are picked first, in document order, then
+    the best sentence or bullet of each section, then the first code example
+    of each section, then the best remaining units; anything that no longer
+    fits is left out, and so is every item of a section whose heading is.
+    """
+    sections = _markdown_sections(_strip_frontmatter(text))
+    units = [
+        (s_idx, i_idx, item)
+        for s_idx, section in enumerate(sections)
+        for i_idx, item in enumerate(section["items"])
+        if item[0] != "code"
+    ]
+    # Each kept line costs its tokens plus a separating newline or two
+    budget = max(ratio * _estimate_tokens(text), DIGEST_MIN_TOKENS)
+    headings = set()
+    chosen = set()
+
+    def take(cost_text: str) -> bool:
+        nonlocal budget
+        cost = _estimate_tokens(cost_text) + 1
+        if cost > budget:
+            return False
+        budget -= cost
+        return True
+
+    for s_idx, section in enumerate(sections):
+        if section["heading"] is None or take(section["heading"]):
+            headings.add(s_idx)
+    scores = _textrank([item[1] for _, _, item in units]) if units else []
+    ranked = [units[i] for i in sorted(range(len(units)), key=lambda i: -scores[i])]
+    best = {}
+    for s_idx, i_idx, item in ranked:
+        best.setdefault(s_idx, (i_idx, item))
+    code = [
+        (s_idx, i_idx, item)
+        for s_idx, section in enumerate(sections)
+        for i_idx, item in enumerate(section["items"])
+        if item[0] == "code"
+    ]
+    candidates = (
+        [(s_idx, i_idx, item) for s_idx, (i_idx, item) in best.items()] + code + ranked
+    )
+    for s_idx, i_idx, item in candidates:
+        if s_idx in headings and (s_idx, i_idx) not in chosen and take(item[1]):
+            chosen.add((s_idx, i_idx))
+
+    blocks = []
+    for s_idx, section in enumerate(sections):
+        if s_idx not in headings:
+            continue
+        kept = [
+            item
+            for i_idx, item in enumerate(section["items"])
+            if (s_idx, i_idx) in chosen
+        ]
+        if section["heading"] is None and not kept:
+            continue
+        lines = [section["heading"]] if section["heading"] else []
+        previous = None
+        for item in kept:
+            if (
+                item[0] == "sentence"
+                and previous
+                and previous[0] == "sentence"
+                and previous[2] == item[2]
+            ):
+                lines[-1] += " " + item[1]
+            else:
+                if lines and not (
+                    item[0] == "bullet" and previous and previous[0] == "bullet"
+                ):
+                    lines.append("")
+                lines.append(item[1])
+            previous = item
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+class DigestIndex:
+    """
+    Extractive digests of markdown files, keyed by the file's SHA-1.
+
+    Digests are content-addressed, so they never go stale: they are kept in
+    an in-memory LRU and persisted as
+    <hub>/.mcp-cache/digests/<sha1>.v<FORMAT>.md, and a file is only
+    summarized again after its content changed.
+    """
+
+    MAX_ENTRIES = 4096
+    # Bumped when the digest algorithm changes, so older digests are not served
+    FORMAT = 2
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.built = 0
+
+    def body(self, sha1: str, cache_dir: Optional[pathlib.Path], text: str) -> str:
+        with self._lock:
+            digest = self._entries.get(sha1)
+            if digest is not None:
+                self._entries.move_to_end(sha1)
+                return digest
+        path = (
+            cache_dir / "digests" / f"{sha1}.v{self.FORMAT}.md" if cache_dir else None
+        )
+        try:
+            digest = path.read_text(encoding="utf-8") if path else None
+        except OSError:
+            digest = None
+        if digest is None:
+            digest = _digest_markdown(text)
+            self.built += 1
+            if path is not None:
+                try:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path = path.with_suffix(".tmp")
+                    tmp_path.write_text(digest, encoding="utf-8")
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    logging.warning(f"Could not write digest {path}: {e}")
+        with self._lock:
+            self._entries[sha1] = digest
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return digest
+
+
+_digests = DigestIndex()
+_digest_cache = ContextCache(CONTEXT_CACHE_MAX_BYTES // 4)
+
+
+def _digest_file_block(
+    block: FileBlock, is_skill_md: bool, cache_dir: Optional[pathlib.Path]
+) -> FileBlock:
+    """Digest one rendered file block; other text files become a pointer."""
+    if is_skill_md:
+        prefix, title = "# Main Skill File: skill.md\n\n", "# Main Skill File: skill.md"
+    else:
+        prefix, title = f"### File: {block.relative}\n\n", f"### File: {block.relative}"
+    if not block.text.startswith(prefix) or not block.digest:
+        return block  # binary files and read errors are already one line
+    digest_id = _version_hash("digest", DigestIndex.FORMAT, block.digest)
+    if not is_skill_md and not block.relative.lower().endswith(MARKDOWN_SUFFIXES):
+        text = f"{title} (not in digest, ~{block.tokens} tokens; use load_skill_file)\n"
+        return _file_block(block.relative, text, digest_id)
+    body = _digests.body(block.digest, cache_dir, block.text[len(prefix) : -1])
+    return _file_block(block.relative, f"{title} (digest)\n\n{body}\n", digest_id)
+
+
+def _load_skill_digest(
+    skill_dir: pathlib.Path, content: Optional[SkillContent] = None
+) -> SkillContent:
+    """Return the digest tier of a skill, derived from its full content."""
+    if content is None:
+        content = _load_skill_content(skill_dir)
+    key = str(skill_dir)
+    cached = _digest_cache.get(key, content.version)
+    if cached is not None:
+        return cached
+    cache_dir = None
+    if _hub_pack is None or key not in _hub_pack.skill_dirs:
+        cache_dir = _skill_cache_dir(skill_dir)
+    md_block = None
+    if content.skill_md is not None:
+        md_block = _digest_file_block(content.skill_md, True, cache_dir)
+    root = tuple(_digest_file_block(b, False, cache_dir) for b in content.root)
+    sub = tuple(_digest_file_block(b, False, cache_dir) for b in content.sub)
+    all_blocks = ((md_block,) if md_block else ()) + root + sub
+    size = sum(len(block.text.encode("utf-8")) for block in all_blocks)
+    digest = SkillContent(md_block, root, sub, size, content.version)
+    _digest_cache.put(key, content.version, digest)
+    return digest
+
+
+TIERS = ("full", "digest")
+
+
+PACK_MAGIC = b"SKPACK2\n"
+
+
+def _decode_text(data) -> str:
+    """Decode file bytes like Path.read_text does (UTF-8, universal newlines)."""
+    return str(data, "utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def compile_hub(output: Optional[pathlib.Path] = None) -> pathlib.Path:
+    """
+    Pack the enabled skills of the active hub into a single file.
+
+    Layout: PACK_MAGIC, 8-byte little-endian header length, JSON header, then
+    the concatenated file blobs. The header maps each skill to its files with
+    (offset, length, size, sha1, tokens, is_text); offsets are relative to the
+    start of the blob section; tokens is the estimate for the rendered file
+    block. Binary files are indexed with their size, but their bytes are not
+    stored (length 0).
+    """
+    snapshot = _catalog.current()
+    hub_dir = snapshot.config_path.parent
+    if output is None:
+        output = hub_dir / CACHE_DIR_NAME / "hub.pack"
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    descriptions = _description_index.describe(
+        hub_dir, [s["path"] for s in snapshot.by_name.values()]
+    )
+    header = {"hub": snapshot.hub_name, "created": time.time(), "skills": {}}
+    offset = 0
+    with tempfile.TemporaryFile() as blobs:
+        for name, skill in snapshot.by_name.items():
+            skill_dir = skill["path"]
+            skill_md, root_files, sub_files = _collect_skill_files(skill_dir)
+            files = []
+            roles = [("skill_md", skill_md)] if skill_md else []
+            roles += [("root", f) for f in root_files] + [("sub", f) for f in sub_files]
+            for role, path in roles:
+                data = path.read_bytes()
+                is_text = role == "skill_md" or _is_text_file(path)
+                relative = path.relative_to(skill_dir).as_posix()
+                entry = {
+                    "path": relative,
+                    "role": role,
+                    "offset": offset,
+                    "length": len(data) if is_text else 0,
+                    "size": len(data),
+                    "sha1": hashlib.sha1(data).hexdigest(),
+                    "is_text": is_text,
+                }
+                entry["tokens"] = _estimate_tokens(_render_pack_entry(entry, data))
+                if is_text:
+                    blobs.write(data)
+                    offset += len(data)
+                files.append(entry)
+            header["skills"][name] = {
+                "path": str(skill_dir),
+                "mode": skill["mode"],
+                "type": skill["type"],
+                "description": descriptions[skill_dir],
+                "files": files,
+            }
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        tmp_output = output.with_suffix(".tmp")
+        with open(tmp_output, "wb") as f:
+            f.write(PACK_MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            blobs.seek(0)
+            shutil.copyfileobj(blobs, f)
+        os.replace(tmp_output, output)
+
+    logging.info(f"Compiled hub '{snapshot.hub_name}' to {output} ({offset} bytes)")
+    return output
+
+
+def _render_pack_entry(entry: Dict, data) -> str:
+    """Format a packed file exactly as the folder-based loader would."""
+    if not entry["is_text"]:
+        return _format_file(entry["path"], None, is_text=False)
+    try:
+        content = _decode_text(data)
+    except UnicodeDecodeError:
+        content = None
+    if entry["role"] == "skill_md":
+        return _format_skill_md(content)
+    return _format_file(entry["path"], content)
+
+
+class HubPack:
+    """
+    Read-only, memory-mapped view of a compiled hub pack.
+
+    File contents are sliced out of the mmap, so serving a skill needs no
+    per-file open() and several server processes share one page cache. The
+    pack is a frozen snapshot: recompile it after changing the hub.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[: len(PACK_MAGIC)] != PACK_MAGIC:
+            if self._mm[:6] == PACK_MAGIC[:6]:
+                raise ValueError(f"Outdated hub pack, recompile it: {path}")
+            raise ValueError(f"Not a skills hub pack: {path}")
+        header_start = len(PACK_MAGIC) + 8
+        header_len = int.from_bytes(self._mm[len(PACK_MAGIC) : header_start], "little")
+        self.header = json.loads(self._mm[header_start : header_start + header_len])
+        self._base = header_start + header_len
+        self._view = memoryview(self._mm)
+        self.skill_dirs = {
+            info["path"]: name for name, info in self.header["skills"].items()
+        }
+        self.version = _version_hash(path, path.stat().st_mtime_ns)
+        self._contents: Dict[str, SkillContent] = {}
+        self._lock = threading.Lock()
+
+    def read(self, entry: Dict) -> memoryview:
+        start = self._base + entry["offset"]
+        return self._view[start : start + entry["length"]]
+
+    def span(self, entry: Dict) -> tuple:
+        """(mmap, start) of a packed file, for searching it in place."""
+        return self._mm, self._base + entry["offset"]
+
+    def find_file(self, name: str, relative: str) -> Optional[Dict]:
+        info = self.header["skills"].get(name)
+        if info is None:
+            return None
+        for entry in info["files"]:
+            if entry["path"] == relative:
+                return entry
+        return None
+
+    def render_file(self, entry: Dict) -> str:
+        return _render_pack_entry(entry, self.read(entry))
+
+    @staticmethod
+    def is_skill_md(entry: Dict) -> bool:
+        """Any file named skill.md, whose frontmatter load_skill_file strips."""
+        return entry["path"].rsplit("/", 1)[-1].lower() == "skill.md"
+
+    def render_loaded_file(self, entry: Dict) -> str:
+        """Format a packed file the way load_skill_file reads one from a folder."""
+        if not self.is_skill_md(entry):
+            return self.render_file(entry)
+        try:
+            content = _strip_frontmatter(_decode_text(self.read(entry)))
+        except UnicodeDecodeError:
+            content = None
+        return _format_file(entry["path"], content)
+
+    def skill_version(self, name: str) -> str:
+        """Content version of a packed skill, equal to its folder manifest's."""
+        files = self.header["skills"][name]["files"]
+        return _version_hash(*(f"{e['path']}:{e['sha1']}" for e in files))
+
+    def skill_content(self, skill_dir: pathlib.Path) -> SkillContent:
+        name = self.skill_dirs[str(skill_dir)]
+        with self._lock:
+            content = self._contents.get(name)
+        if content is not None:
+            return content
+
+        md_block = None
+        root, sub = [], []
+        for entry in self.header["skills"][name]["files"]:
+            block = FileBlock(
+                entry["path"], self.render_file(entry), entry["tokens"], entry["sha1"]
+            )
+            _stats.record_read(entry["length"])
+            if entry["role"] == "skill_md":
+                md_block = block
+            else:
+                (root if entry["role"] == "root" else sub).append(block)
+        blocks = ([md_block] if md_block else []) + root + sub
+        size = sum(len(block.text.encode("utf-8")) for block in blocks)
+        version = self.skill_version(name)
+        content = SkillContent(md_block, tuple(root), tuple(sub), size, version)
+        with self._lock:
+            self._contents[name] = content
+        return content
+
+    def catalog_snapshot(self) -> CatalogSnapshot:
+        contexts_dir, skills_dir, config_path = _hub_paths_for(self.header["hub"])
+        skills = tuple(
+            {
+                "name": name,
+                "path": pathlib.Path(info["path"]),
+                "mode": info["mode"],
+                "type": info["type"],
+            }
+            for name, info in self.header["skills"].items()
+        )
+        return CatalogSnapshot(
+            version=0,
+            hub_name=self.header["hub"],
+            contexts_dir=contexts_dir,
+            skills_dir=skills_dir,
+            config_path=config_path,
+            config={},
+            skills=skills,
+            by_name={s["name"]: s for s in skills},
+        )
+
+    def descriptions(self) -> Dict[pathlib.Path, str]:
+        return {
+            pathlib.Path(info["path"]): info["description"]
+            for info in self.header["skills"].values()
+        }
+
+
+_hub_pack: Optional[HubPack] = None
+
+
+def _use_pack(path: pathlib.Path) -> None:
+    """Serve skills from a compiled pack instead of the live hub folders."""
+    global _hub_pack
+    _hub_pack = HubPack(path)
+    _catalog.pin(_hub_pack.catalog_snapshot())
+    config_mtime = _stat_key(_hub_pack.catalog_snapshot().config_path)
+    if config_mtime and config_mtime[2] > path.stat().st_mtime_ns:
+        logging.warning(f"Hub config changed after {path} was compiled; recompile it")
+    logging.info(
+        f"Serving {len(_hub_pack.skill_dirs)} skills from pack {path} (frozen snapshot)"
+    )
+
+
+DEDUPE_MODES = ("none", "exact", "near")
+
+
+def _check_dedupe(dedupe: str) -> str:
+    dedupe = (dedupe or "none").strip().lower()
+    if dedupe not in DEDUPE_MODES:
+        raise ValueError(f"dedupe must be one of {', '.join(DEDUPE_MODES)}")
+    return dedupe
+
+
+def _render_skills(
+    skills: List[tuple],
+    contents: List[SkillContent],
+    mark_missing: bool,
+    max_tokens: Optional[int] = None,
+    dedupe: str = "none",
+) -> List[Iterator[str]]:
+    """
+    Lazily render [(name, skill_dir)] pairs, optionally packed into a token
+    budget. With dedupe="exact", files identical to one emitted earlier in the
+    response are replaced by a reference; dedupe="near" also drops near-
+    duplicate paragraphs (the budget only counts exact savings). Returns one
+    piece stream per skill (see _skill_parts); consume them in order.
+    """
+    exact = dedupe != "none"
+    with _stats.stage("assembly"):
+        if max_tokens is None:
+            selection = [None] * len(contents)
+        else:
+            selection = _select_within_budget(contents, max_tokens, exact)
+    seen: Optional[Dict[str, str]] = {} if exact else None
+    near = NearDuplicateFilter() if dedupe == "near" else None
+    return [
+        _skill_parts(name, content, mark_missing, included, seen, near)
+        for (name, _), content, included in zip(skills, contents, selection)
+    ]
+
+
+class Assembly:
+    """
+    One paged response, cut lazily from a stream of text pieces.
+
+    Pages are produced on demand and kept, so page N+1 continues the same
+    stream instead of re-rendering it. Pieces larger than a page are split
+    at a line break where possible.
+    """
+
+    def __init__(self, parts: Iterator[str], page_bytes: int):
+        self._parts = parts
+        self._page_bytes = page_bytes
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._exhausted = False
+        self._pages: List[str] = []
+        self._lock = threading.Lock()
+
+    def _fill(self) -> None:
+        """Buffer pieces until a page is available or the stream ends."""
+        while self._pending_bytes <= self._page_bytes and not self._exhausted:
+            part = next(self._parts, None)
+            if part is None:
+                self._exhausted = True
+            elif part:
+                data = part.encode("utf-8")
+                self._pending.append(data)
+                self._pending_bytes += len(data)
+
+    def _cut(self) -> str:
+        data = b"".join(self._pending)
+        cut = len(data)
+        if cut > self._page_bytes:
+            cut = self._page_bytes
+            newline = data.rfind(b"\n", self._page_bytes // 2, cut)
+            if newline != -1:
+                cut = newline + 1
+            while cut and (data[cut] & 0xC0) == 0x80:  # UTF-8 continuation byte
+                cut -= 1
+        rest = data[cut:]
+        self._pending = [rest] if rest else []
+        self._pending_bytes = len(rest)
+        return data[:cut].decode("utf-8")
+
+    def page(self, index: int) -> tuple:
+        """Return (text, has_more) for a 0-based page index."""
+        with self._lock:
+            while len(self._pages) <= index:
+                self._fill()
+                if not self._pending:
+                    raise ValueError(
+                        f"Page {index + 1} is past the end of the response"
+                    )
+                self._pages.append(self._cut())
+            self._fill()
+            has_more = index + 1 < len(self._pages) or bool(self._pending)
+            return self._pages[index], has_more
+
+
+class AssemblyCache:
+    """Small LRU of in-progress paged responses, keyed by response version."""
+
+    MAX_ENTRIES = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Assembly]" = OrderedDict()
+
+    def get(self, version: str, make_parts: Callable[[], Iterator[str]]) -> Assembly:
+        with self._lock:
+            assembly = self._entries.get(version)
+            if assembly is None:
+                assembly = Assembly(make_parts(), PAGE_BYTES)
+                self._entries[version] = assembly
+                while len(self._entries) > self.MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(version)
+            return assembly
+
+
+_assemblies = AssemblyCache()
+
+
+def _paged_response(
+    version: str,
+    make_parts: Callable[[], Iterator[str]],
+    cursor: Optional[str],
+    on_last_page: Optional[Callable[[], None]] = None,
+) -> str:
+    """
+    Serve a versioned response, split into pages of PAGE_BYTES. Every page but
+    the last ends with a <<NEXT_CURSOR ...>> marker; the last one ends with
+    the usual <<VERSION ...>> trailer, so a response that fits in one page is
+    unchanged. A cursor from an older version of the content is rejected.
+    on_last_page runs once the whole response has been served.
+    """
+    index = 0
+    if cursor:
+        cursor_version, _, page = cursor.strip().partition(":")
+        if cursor_version != version or not page.isdigit():
+            raise ValueError(
+                "Cursor expired: the content changed since the first page. "
+                "Call again without cursor."
+            )
+        index = int(page)
+
+    with _stats.stage("assembly"):
+        if PAGE_BYTES <= 0:
+            text, has_more = "".join(make_parts()), False
+        else:
+            text, has_more = _assemblies.get(version, make_parts).page(index)
+    if not has_more:
+        if on_last_page is not None:
+            on_last_page()
+        return _with_version(text, version)
+    next_cursor = f"{version}:{index + 1}"
+    return (
+        f"{text}\n<<NEXT_CURSOR {next_cursor}>> Response continues; "
+        f'call again with cursor="{next_cursor}" for the next page.'
+    )
+
+
+class SessionDeliveries:
+    """
+    Skill versions already delivered to each MCP session.
+
+    get_default_skills and load_full_skill_context consult it so that repeat
+    calls in one session only send skills that are new or changed since; the
+    rest are named in a short "already in context" note. A digest delivery
+    does not count as the full text. The most recent MAX_SESSIONS sessions
+    are kept in memory. A session's state is dropped when its client sends
+    initialize again, since that starts a new conversation.
+    """
+
+    MAX_SESSIONS = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # session id -> {skill name: (content version, tier)}
+        self._sessions: "OrderedDict[str, Dict[str, tuple]]" = OrderedDict()
+        # Bumped on every initialize over stdio, where the transport has no
+        # session id of its own
+        self.stdio_conversation = 0
+
+    def reset(self, session: Optional[str]) -> None:
+        """Forget everything delivered to the session."""
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def restart_stdio(self) -> None:
+        with self._lock:
+            self._sessions.pop(f"stdio:{self.stdio_conversation}", None)
+            self.stdio_conversation += 1
+
+    def has(self, session: Optional[str], name: str, version: str, tier: str) -> bool:
+        if session is None:
+            return False
+        with self._lock:
+            entry = self._sessions.get(session, {}).get(name)
+        return entry is not None and entry[0] == version and entry[1] in ("full", tier)
+
+    def record(self, session: Optional[str], items: List[tuple], tier: str) -> None:
+        """Record [(name, version)] as delivered to the session."""
+        if session is None:
+            return
+        with self._lock:
+            delivered = self._sessions.setdefault(session, {})
+            self._sessions.move_to_end(session)
+            for name, version in items:
+                delivered[name] = (version, tier)
+            while len(self._sessions) > self.MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+
+
+_deliveries = SessionDeliveries()
+
+
+def _session_id(ctx: Optional[Context]) -> Optional[str]:
+    """
+    Id of the calling MCP conversation, or None when calls cannot be told
+    apart. Over stdio it is the conversation started by the client's latest
+    initialize; over HTTP the client is identified by its Mcp-Session-Id
+    header, or by the X-Skills-Session header each mcp_shim.py process sends.
+    """
+    if ctx is None:
+        return None
+    if ctx.transport == "stdio":
+        return f"stdio:{_deliveries.stdio_conversation}"
+    request_context = ctx.request_context
+    request = request_context.request if request_context is not None else None
+    headers = getattr(request, "headers", None)
+    if headers is None:
+        return None
+    return headers.get("mcp-session-id") or headers.get(SESSION_HEADER)
+
+
+class ConversationReset(Middleware):
+    """Drops delivery state when a client (re)initializes its session."""
+
+    async def on_initialize(self, context, call_next):
+        ctx = context.fastmcp_context
+        if ctx is not None and ctx.transport == "stdio":
+            _deliveries.restart_stdio()
+        else:
+            headers = get_http_headers(include_all=True)
+            _deliveries.reset(headers.get(SESSION_HEADER))
+        return await call_next(context)
+
+
+mcp.add_middleware(ConversationReset())
+
+
+def _already_in_context(names: List[str]) -> str:
+    return (
+        f"# Already in context (delivered earlier in this session, unchanged): "
+        f"{', '.join(names)}. Pass resend=true to receive them again."
+    )
+
+
+class UsageLog:
+    """
+    Append-only log of skill discovery and load calls, with the statistics
+    used to predict the next loads.
+
+    Stored as <hub>/.mcp-cache/usage.jsonl with one {"t", "session", "event",
+    "skills"} record per call and replayed into memory when the hub is first
+    used. Records are written with O_APPEND, so several server processes can
+    share the log; every CHECK_EVERY writes the file is rotated to
+    usage.1.jsonl once it passes MAX_BYTES (a rename, which does not race
+    with appends), and only those two files are replayed.
+    An episode runs from a list_available_skills call to the next one
+    in the same session; skills loaded in one episode co-occur, and skills
+    loaded in an episode that began with a discovery call count as "loaded
+    after discovery".
+    """
+
+    MAX_BYTES = 1 << 20
+    CHECK_EVERY = 64
+    MAX_EPISODES = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[pathlib.Path] = None
+        self._writes = 0
+        self.loads: Dict[str, int] = defaultdict(int)
+        self.after_discovery: Dict[str, int] = defaultdict(int)
+        self.together: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # session -> (episode began with discovery, skills loaded in the episode)
+        self._episodes: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _bind(self, hub_dir: pathlib.Path) -> None:
+        path = hub_dir / CACHE_DIR_NAME / "usage.jsonl"
+        if path == self._path:
+            return
+        self._path = path
+        self.loads.clear()
+        self.after_discovery.clear()
+        self.together.clear()
+        self._episodes.clear()
+        self._writes = 0
+        for log_path in (self._rotated_path(), path):
+            try:
+                with open(log_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            self._apply(json.loads(line))
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Ignoring unreadable usage log {log_path}: {e}")
+
+    def _rotated_path(self) -> pathlib.Path:
+        return self._path.with_name("usage.1.jsonl")
+
+    def _rotate(self, fd: int) -> None:
+        """Move the log aside once it is over MAX_BYTES."""
+        st = os.fstat(fd)
+        if st.st_size <= self.MAX_BYTES:
+            return
+        try:
+            # Another process may have rotated it already
+            current = os.stat(self._path)
+            if (current.st_ino, current.st_dev) == (st.st_ino, st.st_dev):
+                os.replace(self._path, self._rotated_path())
+        except OSError as e:
+            logging.debug(f"Could not rotate usage log {self._path}: {e}")
+
+    def _apply(self, record: Dict) -> None:
+        session = record.get("session") or ""
+        if record["event"] == "list":
+            self._episodes[session] = (True, set())
+        else:
+            discovered, loaded = self._episodes.setdefault(session, (False, set()))
+            for name in record["skills"]:
+                self.loads[name] += 1
+                if discovered:
+                    self.after_discovery[name] += 1
+                if name in loaded:
+                    continue
+                for other in loaded:
+                    self.together[name][other] += 1
+                    self.together[other][name] += 1
+                loaded.add(name)
+        self._episodes.move_to_end(session)
+        while len(self._episodes) > self.MAX_EPISODES:
+            self._episodes.popitem(last=False)
+
+    def record(
+        self,
+        hub_dir: pathlib.Path,
+        session: Optional[str],
+        event: str,
+        skills: List[str] = (),
+    ) -> None:
+        record = {"t": round(time.time(), 3), "session": session, "event": event}
+        if event != "list":
+            record["skills"] = list(skills)
+        with self._lock:
+            self._bind(hub_dir)
+            self._apply(record)
+            try:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    # One write() per record, so appends do not interleave
+                    os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+                    if self._writes % self.CHECK_EVERY == 0:
+                        self._rotate(fd)
+                    self._writes += 1
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logging.debug(f"Could not append to usage log {self._path}: {e}")
+
+    def _top(self, counts: Dict[str, int], n: int, exclude=()) -> List[str]:
+        ranked = heapq.nlargest(
+            n + len(exclude), counts.items(), key=lambda x: (x[1], self.loads[x[0]])
+        )
+        return [name for name, _ in ranked if name not in exclude][:n]
+
+    def popular(self, hub_dir: pathlib.Path, n: int) -> List[str]:
+        with self._lock:
+            self._bind(hub_dir)
+            return self._top(self.loads, n)
+
+    def discovery_followups(self, hub_dir: pathlib.Path, n: int) -> List[str]:
+        """Skills most often loaded after a discovery call."""
+        with self._lock:
+            self._bind(hub_dir)
+            return self._top(self.after_discovery, n)
+
+    def related(self, hub_dir: pathlib.Path, names: List[str], n: int) -> List[str]:
+        """Skills most often loaded in the same episode as any of names."""
+        with self._lock:
+            self._bind(hub_dir)
+            counts: Dict[str, int] = defaultdict(int)
+            for name in names:
+                for other, count in self.together.get(name, {}).items():
+                    counts[other] += count
+            return self._top(counts, n, exclude=set(names))
+
+
+_usage = UsageLog()
+
+
+class Prefetcher:
+    """
+    Background thread that records usage events and loads the predicted
+    skills into the content cache, so their first load_full_skill_context
+    call is a cache hit. Tool calls only enqueue work for it. Skills loaded
+    or warmed within the last FRESH_SECONDS are not warmed again.
+    """
+
+    FRESH_SECONDS = 60.0
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending = set()
+        self._fresh: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.warmed = 0
+
+    def _put(self, item) -> None:
+        self._queue.put(item)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def observe(self, session: Optional[str], event: str, skills: List[str]) -> None:
+        """Queue a discovery or load call for logging and prediction."""
+        self._put((_hub_dir(), session, event, list(skills)))
+
+    def submit(self, names: List[str]) -> None:
+        """Queue skills to be loaded into the content cache."""
+        now = time.monotonic()
+        with self._lock:
+            names = [
+                n
+                for n in names
+                if n not in self._pending
+                and now - self._fresh.get(n, -self.FRESH_SECONDS) >= self.FRESH_SECONDS
+            ]
+            self._pending.update(names)
+        for name in names:
+            self._put(name)
+
+    def _warm(self, name: str) -> None:
+        try:
+            _load_skill_content(_get_skill_dir(name))
+            self.warmed += 1
+        except Exception as e:
+            logging.debug(f"Prefetch of {name} skipped: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+                self._fresh[name] = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if isinstance(item, str):
+                self._warm(item)
+                continue
+            hub_dir, session, event, skills = item
+            with self._lock:
+                now = time.monotonic()
+                self._fresh.update((name, now) for name in skills)
+            try:
+                _usage.record(hub_dir, session, event, skills)
+                if event == "list":
+                    predicted = _usage.discovery_followups(hub_dir, PREFETCH_SKILLS)
+                else:
+                    predicted = _usage.related(hub_dir, skills, PREFETCH_SKILLS)
+                self.submit(predicted)
+            except Exception as e:
+                logging.warning(f"Could not record skill usage: {e}")
+
+
+_prefetcher = Prefetcher()
+
+
+def _hub_dir() -> pathlib.Path:
+    return _catalog.current().config_path.parent
+
+
+def _record_usage(ctx: Optional[Context], event: str, skills: List[str] = ()) -> None:
+    """Log a discovery or load call and prefetch the skills likely to follow."""
+    if PREFETCH_SKILLS > 0:
+        _prefetcher.observe(_session_id(ctx), event, skills)
+
+
+def _prefetch_popular() -> None:
+    """Warm the most used skills at startup."""
+    try:
+        _prefetcher.submit(_usage.popular(_hub_dir(), PREFETCH_SKILLS))
+    except Exception as e:
+        logging.warning(f"Could not prefetch popular skills: {e}")
+
+
+_TOKEN_SPLIT_RE = re.compile(r"[^\w\s]")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase, drop punctuation and keep words longer than two characters."""
+    return [w for w in _TOKEN_SPLIT_RE.sub(" ", text.lower()).split() if len(w) > 2]
+
+
+def _skills_hit(changed: set, skill_keys) -> set:
+    """The skill folder keys (str paths) containing any of the changed paths."""
+    hit = set()
+    for path in changed:
+        path = pathlib.Path(path)
+        for parent in (path, *path.parents):
+            if str(parent) in skill_keys:
+                hit.add(str(parent))
+                break
+    return hit
+
+
+def _index_is_current(
+    snapshot: CatalogSnapshot, version: Optional[int], dirty: set, polls
+) -> bool:
+    """
+    Whether an index last refreshed at catalog `version` and watcher poll
+    count `polls` may skip re-checking its skills: the catalog is unchanged,
+    no watchdog event hit one of them and, without path events, the polling
+    watcher has not run since. Without any watcher it never may.
+    """
+    if snapshot.version != version or dirty:
+        return False
+    if _watcher.reports_paths:
+        return True
+    return polls is not None and polls == _watcher.polls
+
+
+class SearchIndex:
+    """
+    Incremental BM25 inverted index over the text files of all enabled skills.
+
+    Documents are individual files (skill.md body, root files, subfolder
+    files). Each skill is indexed against its manifest version: a skill
+    whose version did not change is skipped, and in one that did only files
+    with a new SHA-1 are re-tokenized. With watchdog path events, a refresh
+    is a no-op while the catalog snapshot version is unchanged and no event
+    hit a skill, and otherwise only looks at new skills and the ones hit.
+    With the polling watcher every skill is re-checked at most once per poll,
+    and without a watcher on every refresh. Files of skills that were removed
+    or disabled are dropped.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # doc key (str path) -> {"skill", "path", "relative", "stamp", "length", "terms"}
+        self._docs: Dict[str, Dict] = {}
+        # term -> {doc key: term frequency}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        # skill key (str path) -> (stamp, doc keys)
+        self._skills: Dict[str, tuple] = {}
+        # Catalog snapshot version and watcher poll count of the last refresh,
+        # and skills changed since
+        self._version: Optional[int] = None
+        self._polls: Optional[int] = None
+        self._dirty: set = set()
+
+    def _remove(self, key: str) -> None:
+        doc = self._docs.pop(key)
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+
+    def _add(self, key: str, doc: Dict, text: str) -> None:
+        tokens = _tokenize(text)
+        term_freqs: Dict[str, int] = defaultdict(int)
+        for token in tokens:
+            term_freqs[token] += 1
+        for term, tf in term_freqs.items():
+            self._postings[term][key] = tf
+        doc["length"] = len(tokens)
+        doc["terms"] = tuple(term_freqs)
+        self._docs[key] = doc
+        self._total_length += doc["length"]
+
+    def on_hub_change(self, changed: set, catalog_changed: bool) -> None:
+        """HubWatcher listener: note the skills to re-index on the next query."""
+        if changed:
+            with self._lock:
+                self._dirty |= _skills_hit(changed, self._skills)
+
+    def _refresh_skill(self, skill: Dict) -> None:
+        skill_dir = skill["path"]
+        skill_key = str(skill_dir)
+        manifest, fresh = _manifests.manifest(skill_dir)
+        stamp = (skill["name"], manifest.version)
+        indexed = self._skills.get(skill_key)
+        if indexed is not None and indexed[0] == stamp:
+            return
+        keys = set()
+        for entry in manifest.files:
+            if not entry.is_text:
+                continue
+            path = skill_dir / entry.path
+            key = str(path)
+            keys.add(key)
+            doc_stamp = (skill["name"], entry.sha1)
+            doc = self._docs.get(key)
+            if doc is not None and doc["stamp"] == doc_stamp:
+                continue
+            if doc is not None:
+                self._remove(key)
+            is_skill_md = entry.role == "skill_md"
+            if entry.path in fresh:
+                text = fresh[entry.path]
+                if text is not None and is_skill_md:
+                    text = _strip_frontmatter(text)
+            else:
+                text = _read_search_text(path, is_skill_md)
+            if text is None:
+                keys.discard(key)
+                continue
+            doc = {
+                "skill": skill["name"],
+                "path": path,
+                "relative": entry.path,
+                "stamp": doc_stamp,
+            }
+            self._add(key, doc, text)
+        for key in (indexed[1] - keys) if indexed is not None else ():
+            if key in self._docs:
+                self._remove(key)
+        self._skills[skill_key] = (stamp, keys)
+
+    def refresh(self, snapshot: CatalogSnapshot) -> None:
+        """Bring the index in line with the enabled skills of the snapshot."""
+        polls = _watcher.polls
+        if _index_is_current(snapshot, self._version, self._dirty, self._polls):
+            return
+        check_all = not _watcher.reports_paths
+        dirty, self._dirty = self._dirty, set()
+        seen = set()
+        for skill in snapshot.by_name.values():
+            skill_key = str(skill["path"])
+            seen.add(skill_key)
+            indexed = self._skills.get(skill_key)
+            if (
+                not check_all
+                and skill_key not in dirty
+                and indexed is not None
+                and indexed[0][0] == skill["name"]
+            ):
+                continue
+            try:
+                self._refresh_skill(skill)
+            except OSError:
+                continue
+
+        for skill_key in [k for k in self._skills if k not in seen]:
+            for key in self._skills.pop(skill_key)[1]:
+                if key in self._docs:
+                    self._remove(key)
+        self._version, self._polls = snapshot.version, polls
+
+    def search(self, snapshot: CatalogSnapshot, query: str, top_k: int) -> List[tuple]:
+        """Return [(score, doc)] for the top_k documents matching the query."""
+        query_tokens = _tokenize(query)
+        with _stats.stage("index_update"), self._lock:
+            self.refresh(snapshot)
+            n_docs = len(self._docs)
+            if not n_docs or not query_tokens:
+                return []
+            avgdl = self._total_length / n_docs or 1.0
+
+            scores: Dict[str, float] = defaultdict(float)
+            for token in set(query_tokens):
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1)
+                for key, tf in postings.items():
+                    doc_len = self._docs[key]["length"]
+                    numerator = tf * (self.k1 + 1)
+                    denominator = tf + self.k1 * (1 - self.b + self.b * doc_len / avgdl)
+                    scores[key] += idf * numerator / denominator
+
+            ranked = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+            return [(score, self._docs[key]) for key, score in ranked]
+
+
+def _read_search_text(path: pathlib.Path, is_skill_md: bool) -> Optional[str]:
+    """Text used for indexing/snippets: skill.md body or the raw text file, else None."""
+    if not is_skill_md and not _is_text_file(path):
+        return None
+    try:
+        content = path.read_text(encoding="utf-8")
+    except Exception:
+        return None
+    _stats.record_read(len(content))
+    return _strip_frontmatter(content) if is_skill_md else content
+
+
+def _make_snippet(text: str, query_tokens: set, max_chars: int = 300) -> str:
+    """Pick the line with the most query terms and return it with one line of context."""
+    lines = text.splitlines()
+    best_idx, best_hits = 0, 0
+    for idx, line in enumerate(lines):
+        hits = len(query_tokens.intersection(_tokenize(line)))
+        if hits > best_hits:
+            best_idx, best_hits = idx, hits
+    window = [l.strip() for l in lines[max(0, best_idx - 1) : best_idx + 2]]
+    snippet = " ".join(l for l in window if l)
+    if len(snippet) > max_chars:
+        snippet = snippet[: max_chars - 3].rstrip() + "..."
+    return snippet
+
+
+_search_index = SearchIndex()
+
+
+def _skill_markdown_version(skill_dir: pathlib.Path) -> str:
+    """Content version of a skill, from its manifest or the pack header."""
+    if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+        return _hub_pack.skill_version(_hub_pack.skill_dirs[str(skill_dir)])
+    manifest, _ = _manifests.manifest(skill_dir)
+    return manifest.version
+
+
+def _skill_headings(skill_dir: pathlib.Path) -> List[str]:
+    """Headings of all markdown files of a skill, in context load order."""
+    if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+        info = _hub_pack.header["skills"][_hub_pack.skill_dirs[str(skill_dir)]]
+        outlines = (
+            _build_outline(bytes(_hub_pack.read(e)))
+            for e in info["files"]
+            if e["path"].lower().endswith(MARKDOWN_SUFFIXES)
+        )
+    else:
+        outlines = (
+            _outline_index.outline(path) for path in _skill_markdown_files(skill_dir)
+        )
+    return [section["heading"] for outline in outlines for section in outline]
+
+
+class SkillRecommender:
+    """
+    TF-IDF vectors of the enabled dynamic skills (name, description and the
+    headings of their markdown files) for ranking skills against a task.
+
+    Vectors are sparse postings (term -> {skill: term frequency}), so IDF
+    weights follow from the posting lengths. A skill is re-tokenized only when
+    its description or content version changed; document norms are
+    recomputed lazily after any change.
+
+    When the hub watcher reports changed paths (watchdog), a refresh is a
+    no-op while the catalog snapshot version is unchanged and no event hit a
+    skill, and otherwise re-checks only new skills and the skills that were
+    hit. With the polling watcher each skill's version is re-checked at most
+    once per poll, and without a watcher on every refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # skill key (str path) -> {"stamp", "name", "description", "terms"}
+        self._docs: Dict[str, Dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._norms: Optional[Dict[str, float]] = None
+        # Catalog snapshot version and watcher poll count of the last refresh,
+        # and skills changed since
+        self._version: Optional[int] = None
+        self._polls: Optional[int] = None
+        self._dirty: set = set()
+
+    def _remove(self, key: str) -> None:
+        doc = self._docs.pop(key)
+        for term in doc["terms"]:
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+        self._norms = None
+
+    def _weight(self, tf: int, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        return (1 + math.log(tf)) * (math.log((1 + len(self._docs)) / (1 + df)) + 1)
+
+    def on_hub_change(self, changed: set, catalog_changed: bool) -> None:
+        """HubWatcher listener: note the skills to re-check on the next refresh."""
+        if changed:  # a catalog change shows in the snapshot version
+            with self._lock:
+                self._dirty |= _skills_hit(changed, self._docs)
+
+    def refresh(self, snapshot: CatalogSnapshot) -> None:
+        """Bring the vectors in line with the dynamic skills of the snapshot."""
+        polls = _watcher.polls
+        with self._lock:
+            if _index_is_current(snapshot, self._version, self._dirty, self._polls):
+                return
+            dirty, self._dirty = self._dirty, set()
+        check_all = not _watcher.reports_paths
+        descriptions = {
+            item["name"]: item["description"] for item in _backend.list_skills(snapshot)
+        }
+        with self._lock:
+            seen = set()
+            for skill in snapshot.skills:
+                if skill["mode"] != "dynamic":
+                    continue
+                key = str(skill["path"])
+                seen.add(key)
+                if not check_all and key in self._docs and key not in dirty:
+                    continue
+                description = descriptions.get(skill["name"], NO_DESCRIPTION)
+                try:
+                    stamp = (
+                        skill["name"],
+                        description,
+                        _skill_markdown_version(skill["path"]),
+                    )
+                    doc = self._docs.get(key)
+                    if doc is not None and doc["stamp"] == stamp:
+                        continue
+                    headings = _skill_headings(skill["path"])
+                except OSError:
+                    continue
+                if doc is not None:
+                    self._remove(key)
+                term_freqs: Dict[str, int] = defaultdict(int)
+                for token in _tokenize(
+                    " ".join([skill["name"], description, *headings])
+                ):
+                    term_freqs[token] += 1
+                for term, tf in term_freqs.items():
+                    self._postings[term][key] = tf
+                self._docs[key] = {
+                    "stamp": stamp,
+                    "name": skill["name"],
+                    "description": description,
+                    "terms": dict(term_freqs),
+                }
+                self._norms = None
+
+            for key in [k for k in self._docs if k not in seen]:
+                self._remove(key)
+            self._version, self._polls = snapshot.version, polls
+
+    def warm(self) -> None:
+        try:
+            self.refresh(_catalog.current())
+        except Exception as e:
+            logging.warning(f"Could not build skill recommendations index: {e}")
+
+    def recommend(self, snapshot: CatalogSnapshot, task: str, k: int) -> List[tuple]:
+        """Return [(score, doc)] for the k skills most similar to the task."""
+        with _stats.stage("index_update"):
+            self.refresh(snapshot)
+        query_freqs: Dict[str, int] = defaultdict(int)
+        for token in _tokenize(task):
+            query_freqs[token] += 1
+        with self._lock:
+            if self._norms is None:
+                self._norms = {
+                    key: math.sqrt(
+                        sum(self._weight(tf, t) ** 2 for t, tf in doc["terms"].items())
+                    )
+                    for key, doc in self._docs.items()
+                }
+            query = {
+                term: self._weight(tf, term)
+                for term, tf in query_freqs.items()
+                if term in self._postings
+            }
+            query_norm = math.sqrt(sum(w * w for w in query.values()))
+            if not query_norm:
+                return []
+            scores: Dict[str, float] = defaultdict(float)
+            for term, weight in query.items():
+                for key, tf in self._postings[term].items():
+                    scores[key] += weight * self._weight(tf, term)
+            for key in scores:
+                scores[key] /= query_norm * (self._norms[key] or 1.0)
+            ranked = heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+            return [(score, self._docs[key]) for key, score in ranked]
+
+
+_recommender = SkillRecommender()
+
+
+_HEADING_RE = re.compile(rb"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+_FENCE_RE = re.compile(rb"^[ \t]*(```|~~~)")
+_FRONTMATTER_END_RE = re.compile(rb"^---\n[\s\S]*?\n---\n")
+
+SECTION_SEPARATOR = " > "
+
+
+def _build_outline(data: bytes) -> List[Dict]:
+    """
+    Scan markdown bytes for ATX headings (outside code fences and frontmatter).
+    Returns [{heading, level, path, start, end}] with byte offsets of each section.
+    """
+    sections = []
+    stack: List[tuple] = []  # (level, heading)
+    offset = 0
+    frontmatter = _FRONTMATTER_END_RE.match(data)
+    if frontmatter:
+        offset = frontmatter.end()
+    in_fence = False
+
+    for line in data[offset:].splitlines(keepends=True):
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = _HEADING_RE.match(line.rstrip(b"\r\n"))
+            if match:
+                level = len(match.group(1))
+                heading = match.group(2).decode("utf-8", errors="replace").strip()
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, heading))
+                sections.append(
+                    {
+                        "heading": heading,
+                        "level": level,
+                        "path": SECTION_SEPARATOR.join(h for _, h in stack),
+                        "start": offset,
+                        "end": len(data),
+                    }
+                )
+        offset += len(line)
+
+    # A section ends where the next heading of the same or higher level starts
+    for idx, section in enumerate(sections):
+        for following in sections[idx + 1 :]:
+            if following["level"] <= section["level"]:
+                section["end"] = following["start"]
+                break
+    return sections
+
+
+class OutlineIndex:
+    """
+    Cached heading -> byte offset index for markdown files.
+
+    Entries are validated against the file's (size, mtime_ns); sections are
+    then served by seeking to the stored offset instead of re-reading and
+    re-parsing the whole file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}
+
+    def outline(self, path: pathlib.Path) -> List[Dict]:
+        st = path.stat()
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == (st.st_size, st.st_mtime_ns):
+                return entry[2]
+        data = path.read_bytes()
+        _stats.record_read(len(data))
+        sections = _build_outline(data)
+        with self._lock:
+            self._entries[key] = (st.st_size, st.st_mtime_ns, sections)
+        return sections
+
+    def read_section(self, path: pathlib.Path, section: Dict) -> str:
+        with open(path, "rb") as f:
+            f.seek(section["start"])
+            data = f.read(section["end"] - section["start"])
+        _stats.record_read(len(data))
+        return data.decode("utf-8", errors="replace")
+
+
+_outline_index = OutlineIndex()
+
+
+class LineIndex:
+    """
+    Cached line-start offsets of skill files, for paging through large files.
+
+    An index is built with one pass over a read-only mmap of the file and
+    validated against its stat key; line and byte ranges are then sliced out
+    of the mmap, so reading lines 4000-4200 of a 2 MB reference file touches
+    only those pages instead of the whole file.
+    """
+
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _line_starts(self, key: str, stamp, buf, start: int, size: int) -> array.array:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+        starts = array.array("Q", [0])
+        end = start + size
+        pos = buf.find(b"\n", start, end)
+        while pos != -1 and pos + 1 < end:
+            starts.append(pos + 1 - start)
+            pos = buf.find(b"\n", pos + 1, end)
+        _stats.record_read(size)
+        with self._lock:
+            self._entries[key] = (stamp, starts)
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return starts
+
+    def read(
+        self,
+        key: str,
+        stamp,
+        buf,
+        start: int,
+        size: int,
+        start_line: Optional[int],
+        end_line: Optional[int],
+        offset: Optional[int],
+        length: Optional[int],
+    ) -> tuple:
+        """
+        Slice a line range (1-based, inclusive) or byte range out of buf, where
+        the file occupies buf[start:start + size]. Returns (text, label).
+        """
+        if offset is not None or length is not None:
+            lo = min(max(offset or 0, 0), size)
+            hi = size if length is None else min(lo + max(length, 0), size)
+            label = f"bytes {lo}-{max(hi - 1, lo)} of {size}"
+        else:
+            starts = self._line_starts(key, stamp, buf, start, size) if size else [0]
+            total = len(starts) if size else 0
+            first = max(start_line or 1, 1)
+            last = min(end_line or total, total)
+            if first > last:
+                return "", f"lines {first}-{end_line or first} of {total}"
+            lo = starts[first - 1]
+            hi = starts[last] if last < total else size
+            label = f"lines {first}-{last} of {total}"
+        data = bytes(buf[start + lo : start + hi])
+        _stats.record_read(len(data))
+        return data.decode("utf-8", errors="replace"), label
+
+
+_line_index = LineIndex()
+
+
+def _skill_markdown_files(skill_dir: pathlib.Path) -> List[pathlib.Path]:
+    """Markdown files of a skill in context load order."""
+    skill_md, root_files, sub_files = _collect_skill_files(skill_dir)
+    files = ([skill_md] if skill_md else []) + root_files + sub_files
+    return [f for f in files if f.suffix.lower() in (".md", ".mdx", ".markdown")]
+
+
+class FileBackend:
+    """Default storage backend: reads the hub folders through the in-memory indexes."""
+
+    name = "files"
+
+    def list_skills(self, snapshot: CatalogSnapshot) -> List[Dict]:
+        if _hub_pack is not None:
+            descriptions = _hub_pack.descriptions()
+        else:
+            descriptions = _description_index.describe(
+                snapshot.config_path.parent, [s["path"] for s in snapshot.skills]
+            )
+        return [
+            {
+                "name": skill["name"],
+                "description": descriptions[skill["path"]],
+                "mode": skill["mode"],
+                "type": skill["type"],
+            }
+            for skill in snapshot.skills
+        ]
+
+    def search(self, snapshot: CatalogSnapshot, query: str, top_k: int) -> List[Dict]:
+        query_tokens = set(_tokenize(query))
+        results = []
+        for score, doc in _search_index.search(snapshot, query, top_k):
+            is_skill_md = doc["relative"].lower() == "skill.md"
+            text = _read_search_text(doc["path"], is_skill_md)
+            results.append(
+                {
+                    "name": doc["skill"],
+                    "file": doc["relative"],
+                    "score": round(score, 3),
+                    "snippet": _make_snippet(text or "", query_tokens),
+                }
+            )
+        return results
+
+
+class SqliteBackend:
+    """
+    SQLite mirror of the active hub: contexts, toggles, modes, descriptions and
+    the text of every enabled skill file in an FTS5 table.
+
+    The database lives at <hub>/.mcp-cache/skills.db in WAL mode, so several
+    MCP processes can read it concurrently. Metadata is re-mirrored when the
+    catalog version changes and descriptions when a skill.md's (size,
+    mtime_ns) changed. File rows are synced per skill against its manifest
+    version, the way SearchIndex.refresh does: a search against an unchanged
+    hub runs only the FTS query, except for the first search after each poll
+    of the polling watcher. Listing and
+    search are then SQL queries.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contexts (
+            folder TEXT PRIMARY KEY, name TEXT, enabled INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS skills (
+            path TEXT PRIMARY KEY, name TEXT, context TEXT, type TEXT, mode TEXT,
+            enabled INTEGER, present INTEGER DEFAULT 0, description TEXT,
+            md_size INTEGER, md_mtime_ns INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS skills_present ON skills (present, name);
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY, path TEXT UNIQUE, skill TEXT, relative TEXT,
+            size INTEGER, mtime_ns INTEGER
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(body);
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db_path: Optional[pathlib.Path] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._synced_version = None
+        # skill key (str path) -> (name, manifest version) of its file rows
+        self._skills: Dict[str, tuple] = {}
+        # Catalog snapshot version and watcher poll count of the last file
+        # sync, and skills changed since
+        self._files_version: Optional[int] = None
+        self._files_polls: Optional[int] = None
+        self._dirty: set = set()
+
+    def _connect(self, snapshot: CatalogSnapshot) -> sqlite3.Connection:
+        db_path = snapshot.config_path.parent / CACHE_DIR_NAME / "skills.db"
+        if db_path != self._db_path:
+            if self._conn is not None:
+                self._conn.close()
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                db_path, check_same_thread=False, isolation_level=None, timeout=10
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn, self._db_path, self._synced_version = conn, db_path, None
+            self._skills, self._files_version = {}, None
+            logging.info(f"SQLite backend using {db_path}")
+        return self._conn
+
+    def _sync_metadata(self, conn: sqlite3.Connection, snapshot: CatalogSnapshot):
+        if self._synced_version == snapshot.version:
+            return
+        present = {str(s["path"]) for s in snapshot.skills}
+        contexts, skills = [], []
+        for ctx in snapshot.config.get("context_cells", []):
+            folder = ctx.get("folder", "")
+            contexts.append((folder, ctx.get("name", folder), ctx.get("enabled", True)))
+            for kind, key in (("skill", "skills"), ("workflow", "workflows")):
+                for name, toggle in ctx.get(key, {}).items():
+                    path = str(snapshot.contexts_dir / folder / name)
+                    skills.append(
+                        (
+                            path,
+                            name,
+                            folder,
+                            kind,
+                            toggle.get("mode", "always_loaded"),
+                            toggle.get("enabled", True),
+                            path in present,
+                        )
+                    )
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM contexts")
+            conn.executemany(
+                "INSERT OR REPLACE INTO contexts VALUES (?, ?, ?)", contexts
+            )
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS live (path TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM live")
+            conn.executemany(
+                "INSERT OR IGNORE INTO live VALUES (?)", ((row[0],) for row in skills)
+            )
+            conn.execute("DELETE FROM skills WHERE path NOT IN (SELECT path FROM live)")
+            conn.executemany(
+                """
+                INSERT INTO skills (path, name, context, type, mode, enabled, present)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    name = excluded.name, context = excluded.context,
+                    type = excluded.type, mode = excluded.mode,
+                    enabled = excluded.enabled, present = excluded.present
+                """,
+                skills,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._synced_version = snapshot.version
+
+    def _sync_descriptions(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute(
+            "SELECT path, md_size, md_mtime_ns FROM skills WHERE present = 1"
+        ).fetchall()
+        updates = []
+        for path, md_size, md_mtime_ns in rows:
+            skill_md = _find_skill_md(pathlib.Path(path))
+            if skill_md is None:
+                updates.append((NO_DESCRIPTION, None, None, path))
+                continue
+            st = skill_md.stat()
+            if (md_size, md_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                continue
+            try:
+                content = skill_md.read_text(encoding="utf-8")
+                _stats.record_read(st.st_size)
+                description = _parse_description(content)
+            except Exception:
+                description = "Error reading skill.md frontmatter"
+            updates.append((description, st.st_size, st.st_mtime_ns, path))
+        if updates:
+            conn.executemany(
+                "UPDATE skills SET description = ?, md_size = ?, md_mtime_ns = ? "
+                "WHERE path = ?",
+                updates,
+            )
+
+    def on_hub_change(self, changed: set, catalog_changed: bool) -> None:
+        """HubWatcher listener: note the skills to re-sync on the next search."""
+        if changed:
+            with self._lock:
+                self._dirty |= _skills_hit(changed, self._skills)
+
+    def _file_rows(self, conn: sqlite3.Connection, skill_keys) -> Dict[str, tuple]:
+        """{path: (skill, size, mtime_ns, id)} of the file rows (all when None)."""
+        query = "SELECT path, skill, size, mtime_ns, id FROM files"
+        if skill_keys is None:
+            return {row[0]: row[1:] for row in conn.execute(query)}
+        rows = {}
+        for skill_key in skill_keys:
+            # Every path under skill_key + os.sep sorts below skill_key + next char
+            bounds = (skill_key + os.sep, skill_key + chr(ord(os.sep) + 1))
+            for row in conn.execute(f"{query} WHERE path >= ? AND path < ?", bounds):
+                rows[row[0]] = row[1:]
+        return rows
+
+    def _sync_files(self, conn: sqlite3.Connection, snapshot: CatalogSnapshot):
+        polls = _watcher.polls
+        if _index_is_current(
+            snapshot, self._files_version, self._dirty, self._files_polls
+        ):
+            return
+        check_all = not _watcher.reports_paths
+        dirty, self._dirty = self._dirty, set()
+        seen, stale = set(), []
+        for skill in snapshot.by_name.values():
+            skill_key = str(skill["path"])
+            seen.add(skill_key)
+            synced = self._skills.get(skill_key)
+            if (
+                not check_all
+                and skill_key not in dirty
+                and synced is not None
+                and synced[0] == skill["name"]
+            ):
+                continue
+            try:
+                manifest, fresh = _manifests.manifest(skill["path"])
+            except OSError:
+                continue
+            stamp = (skill["name"], manifest.version)
+            if stamp != synced:
+                stale.append((skill, manifest, fresh, stamp))
+        gone = [skill_key for skill_key in self._skills if skill_key not in seen]
+        if not stale and not gone:
+            self._files_version, self._files_polls = snapshot.version, polls
+            return
+
+        # The first sync against a database also drops rows left by skills
+        # that are no longer enabled
+        first = self._files_version is None
+        known = self._file_rows(
+            conn, None if first else [str(s["path"]) for s, *_ in stale] + gone
+        )
+        live = set()
+        changed = []
+        for skill, manifest, fresh, _ in stale:
+            skill_dir = skill["path"]
+            for entry in manifest.files:
+                key = str(skill_dir / entry.path)
+                live.add(key)
+                row = known.get(key)
+                if row is not None and row[:3] == (
+                    skill["name"],
+                    entry.size,
+                    entry.mtime_ns,
+                ):
+                    continue
+                is_skill_md = entry.role == "skill_md"
+                if not entry.is_text:
+                    text = None
+                elif entry.path in fresh:
+                    text = fresh[entry.path]
+                    if text is not None and is_skill_md:
+                        text = _strip_frontmatter(text)
+                else:
+                    text = _read_search_text(skill_dir / entry.path, is_skill_md)
+                changed.append(
+                    (key, skill["name"], entry.path, entry.size, entry.mtime_ns, text)
+                )
+        removed = [row[3] for path, row in known.items() if path not in live]
+        if changed or removed:
+            self._write_files(conn, changed, removed)
+        for skill, _, _, stamp in stale:
+            self._skills[str(skill["path"])] = stamp
+        for skill_key in gone:
+            del self._skills[skill_key]
+        self._files_version, self._files_polls = snapshot.version, polls
+
+    def _write_files(self, conn: sqlite3.Connection, changed: List, removed: List):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for file_id in removed:
+                conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                conn.execute("DELETE FROM files_fts WHERE rowid = ?", (file_id,))
+            for key, skill_name, relative, size, mtime_ns, text in changed:
+                old = conn.execute("SELECT id FROM files WHERE path = ?", (key,))
+                for (file_id,) in old.fetchall():
+                    conn.execute("DELETE FROM files_fts WHERE rowid = ?", (file_id,))
+                conn.execute("DELETE FROM files WHERE path = ?", (key,))
+                cursor = conn.execute(
+                    "INSERT INTO files (path, skill, relative, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, skill_name, relative, size, mtime_ns),
+                )
+                if text is not None:
+                    conn.execute(
+                        "INSERT INTO files_fts (rowid, body) VALUES (?, ?)",
+                        (cursor.lastrowid, text),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logging.debug(
+            f"SQLite mirror: {len(changed)} files updated, {len(removed)} removed"
+        )
+
+    def list_skills(self, snapshot: CatalogSnapshot) -> List[Dict]:
+        with _stats.stage("descriptions"), self._lock:
+            conn = self._connect(snapshot)
+            self._sync_metadata(conn, snapshot)
+            self._sync_descriptions(conn)
+            rows = conn.execute(
+                "SELECT name, description, mode, type FROM skills WHERE present = 1"
+            ).fetchall()
+        return [
+            {"name": name, "description": description, "mode": mode, "type": kind}
+            for name, description, mode, kind in rows
+        ]
+
+    def search(self, snapshot: CatalogSnapshot, query: str, top_k: int) -> List[Dict]:
+        tokens = list(dict.fromkeys(_tokenize(query)))
+        if not tokens:
+            return []
+        with _stats.stage("index_update"), self._lock:
+            conn = self._connect(snapshot)
+            self._sync_metadata(conn, snapshot)
+            self._sync_files(conn, snapshot)
+            rows = conn.execute(
+                """
+                SELECT f.skill, f.relative, bm25(files_fts) AS rank,
+                       snippet(files_fts, 0, '', '', '...', 40)
+                FROM files_fts JOIN files f ON f.id = files_fts.rowid
+                WHERE files_fts MATCH ? ORDER BY rank LIMIT ?
+                """,
+                (" OR ".join(f'"{t}"' for t in tokens), top_k),
+            ).fetchall()
+        return [
+            {
+                "name": skill,
+                "file": relative,
+                "score": round(-rank, 3),
+                "snippet": " ".join(snippet.split()),
+            }
+            for skill, relative, rank, snippet in rows
+        ]
+
+
+_backend = SqliteBackend() if STORAGE_BACKEND == "sqlite" else FileBackend()
+
+
+@mcp.tool
+@_stats.instrument
+def list_available_skills(
+    if_none_match: Optional[str] = None, ctx: Optional[Context] = None
+) -> Dict:
+    """
+    List available skills to help decide which one to use.
+    Only returns skills that the user has explicitly enabled.
+    Skills marked as 'always_loaded' are auto-loaded into context.
+    Skills marked as 'dynamic' are listed here for on-demand loading.
+    Returns {"version": ..., "skills": [...]}. Pass a previous version as
+    if_none_match to get {"version": ..., "unchanged": true} when nothing changed.
+
+    Usage:
+    Call this tool to discover what skills are available.
+    Example: list_available_skills()
+    Example: list_available_skills(if_none_match="3f2a9c0d41be7a55")
+    """
+    _record_usage(ctx, "list")
+    items = _backend.list_skills(_catalog.current())
+    items.sort(key=lambda x: x["name"])
+
+    version = _version_hash(json.dumps(items, sort_keys=True))
+    if if_none_match and if_none_match.strip() == version:
+        return {"version": version, "unchanged": True}
+    return {"version": version, "skills": items}
+
+
+@mcp.tool
+@_stats.instrument
+def get_default_skills(
+    max_tokens: Optional[int] = None,
+    if_none_match: Optional[str] = None,
+    cursor: Optional[str] = None,
+    dedupe: str = "exact",
+    tier: str = "full",
+    resend: bool = True,
+    ctx: Optional[Context] = None,
+) -> str:
+    """
+    Load all skills marked as 'default' mode. These skills should
+    ALWAYS be loaded into the AI context at the start of every conversation.
+    Optional max_tokens caps the response size: skill.md bodies are packed
+    first, then root files, then subfolder files; files that do not fit are
+    listed in an "Omitted Files" manifest instead.
+    The response ends with <<VERSION ...>>; pass that value as if_none_match
+    to get a short <<UNCHANGED ...>> marker when nothing changed.
+    Very large responses are split into pages: a page ending in
+    <<NEXT_CURSOR ...>> continues when you call again with that cursor.
+    dedupe="exact" (default) emits files that several skills share only
+    once and refers back to them; dedupe="near" also drops paragraphs that
+    nearly repeat earlier ones; dedupe="none" emits every copy.
+    tier="digest" loads an extractive digest of every skill instead (headings,
+    key points and code examples, at most ~12% of each markdown file);
+    load a skill's full text with load_full_skill_context when you need it.
+    Everything is sent on every call by default. Pass resend=false to skip
+    skills already delivered in this session and unchanged since; they are
+    then only listed as already in context, so only do that while the earlier
+    response is still in your context (not after compaction).
+
+    Usage:
+    Call this tool at the beginning of every session to load default skills.
+    Example: get_default_skills()
+    Example: get_default_skills(max_tokens=20000)
+    Example: get_default_skills(if_none_match="3f2a9c0d41be7a55")
+    Example: get_default_skills(cursor="3f2a9c0d41be7a55:1")
+    Example: get_default_skills(dedupe="near")
+    Example: get_default_skills(tier="digest")
+    Example: get_default_skills(resend=False)
+    """
+    always_loaded_skills = [
+        s for s in _get_enabled_skills() if s["mode"] == "always_loaded"
+    ]
+
+    if not always_loaded_skills:
+        return "No always_loaded skills configured."
+
+    dedupe = _check_dedupe(dedupe)
+    tier = (tier or "full").strip().lower()
+    if tier not in TIERS:
+        raise ValueError(f"tier must be one of {', '.join(TIERS)}")
+    paths = [skill["path"] for skill in always_loaded_skills]
+    loaded = _load_skill_contents(paths)
+    if tier == "digest":
+        loaded = [_load_skill_digest(p, c) for p, c in zip(paths, loaded)]
+    session = _session_id(ctx)
+    skills, contents, already = [], [], []
+    for skill, content in zip(always_loaded_skills, loaded):
+        if not resend and _deliveries.has(
+            session, skill["name"], content.version, tier
+        ):
+            already.append(skill["name"])
+        else:
+            skills.append((skill["name"], skill["path"]))
+            contents.append(content)
+    version = _version_hash(
+        max_tokens,
+        dedupe,
+        tier,
+        *(f"{n}:{c.version}" for (n, _), c in zip(skills, contents)),
+        *(f"{n}:delivered" for n in already),
+    )
+    if if_none_match and if_none_match.strip() == version and not cursor:
+        return _unchanged_marker(version)
+
+    def make_parts() -> Iterator[str]:
+        for idx, parts in enumerate(
+            _render_skills(skills, contents, False, max_tokens, dedupe)
+        ):
+            if idx:
+                yield "\n\n"
+            yield from parts
+            yield "\n"
+        if already:
+            yield "\n" if skills else ""
+            yield _already_in_context(already) + "\n"
+
+    def delivered() -> None:
+        if max_tokens is None:
+            items = [(n, c.version) for (n, _), c in zip(skills, contents)]
+            _deliveries.record(session, items, tier)
+
+    return _paged_response(version, make_parts, cursor, delivered)
+
+
+@mcp.tool
+@_stats.instrument
+def load_full_skill_context(
+    name: str,
+    max_tokens: Optional[int] = None,
+    if_none_match: Optional[str] = None,
+    cursor: Optional[str] = None,
+    resend: bool = True,
+    ctx: Optional[Context] = None,
+) -> str:
+    """
+    Load the skill context.
+    Order: 1. skill.md (body only, frontmatter excluded) -> 2. Root files (A-Z) -> 3. Subfolders (A-Z).
+    Excludes: description.md (legacy), frontmatter from skill.md
+    Wraps content in <<START skill>> ... << END skill>>.
+    Optional max_tokens caps the response size; files that do not fit are
+    listed in an "Omitted Files" manifest instead of being loaded.
+    The response ends with <<VERSION ...>>; pass that value as if_none_match
+    to get a short <<UNCHANGED ...>> marker when the skill did not change.
+    Very large skills are split into pages: a page ending in
+    <<NEXT_CURSOR ...>> continues when you call again with that cursor.
+    The skill is sent on every call by default. Pass resend=false to get only
+    a short "already in context" note when it was delivered in this session
+    and has not changed since; only do that while the earlier response is
+    still in your context (not after compaction).
+
+    Usage:
+    Call this tool to load the full content of a skill into the context.
+    Example: load_full_skill_context(name="python-expert")
+    Example: load_full_skill_context(name="python-expert", max_tokens=8000)
+    Example: load_full_skill_context(name="python-expert", cursor="3f2a9c0d41be7a55:1")
+    Example: load_full_skill_context(name="python-expert", resend=False)
+    """
+    skill_dir = _get_skill_dir(name)
+    _record_usage(ctx, "load", [name])
+    content = _load_skill_content(skill_dir)
+    version = _version_hash(name, max_tokens, content.version)
+    if if_none_match and if_none_match.strip() == version and not cursor:
+        return _unchanged_marker(version)
+    session = _session_id(ctx)
+    if (
+        not resend
+        and not cursor
+        and _deliveries.has(session, name, content.version, "full")
+    ):
+        return _with_version(_already_in_context([name]), version)
+
+    def delivered() -> None:
+        if max_tokens is None:
+            _deliveries.record(session, [(name, content.version)], "full")
+
+    return _paged_response(
+        version,
+        lambda: _render_skills([(name, skill_dir)], [content], True, max_tokens)[0],
+        cursor,
+        delivered,
+    )
+
+
+@mcp.tool
+@_stats.instrument
+def load_skill_digest(name: str, if_none_match: Optional[str] = None) -> str:
+    """
+    Load an extractive digest of a skill: its headings, the key sentences and
+    bullet points (ranked with TextRank) and the first code example of the
+    sections, at most ~12% of each markdown file. Non-markdown files are
+    listed with their size instead of being loaded.
+    The response ends with <<VERSION ...>> like load_full_skill_context.
+
+    Usage:
+    Call this tool to skim a skill cheaply; load_full_skill_context or
+    load_skill_section when you need the complete text.
+    Example: load_skill_digest(name="python-expert")
+    """
+    skill_dir = _get_skill_dir(name)
+    content = _load_skill_digest(skill_dir)
+    version = _version_hash(name, "digest", content.version)
+    if if_none_match and if_none_match.strip() == version:
+        return _unchanged_marker(version)
+
+    return _paged_response(
+        version,
+        lambda: _render_skills([(name, skill_dir)], [content], True)[0],
+        None,
+    )
+
+
+@mcp.tool
+@_stats.instrument
+def load_skills(
+    names: List[str],
+    max_tokens: Optional[int] = None,
+    dedupe: str = "exact",
+    if_none_match: Optional[str] = None,
+    cursor: Optional[str] = None,
+    ctx: Optional[Context] = None,
+) -> str:
+    """
+    Load several skills in one call (same format as load_full_skill_context).
+    All names are resolved against one consistent view of the hub; names that
+    cannot be resolved are reported at the end instead of failing the batch.
+    Optional max_tokens and dedupe work like in get_default_skills.
+    The response ends with <<VERSION ...>>; pass that value as if_none_match
+    to get a short <<UNCHANGED ...>> marker when none of the skills changed.
+    Very large responses are split into pages: a page ending in
+    <<NEXT_CURSOR ...>> continues when you call again with that cursor.
+
+    Usage:
+    Call this tool instead of several load_full_skill_context calls in a row.
+    Example: load_skills(names=["react-guide", "fastapi-guide"])
+    Example: load_skills(names=["react-guide", "fastapi-guide"], cursor="3f2a9c0d41be7a55:1")
+    """
+    dedupe = _check_dedupe(dedupe)
+    snapshot = _catalog.current()
+    resolved = []
+    errors = []
+    for name in dict.fromkeys(n.strip().strip("'").strip('"') for n in names):
+        try:
+            resolved.append((name, _get_skill_dir(name, snapshot)))
+        except ValueError as e:
+            errors.append(f"- {name}: {e}")
+    if not resolved and not errors:
+        return "No skills requested."
+
+    if resolved:
+        _record_usage(ctx, "load", [name for name, _ in resolved])
+    contents = _load_skill_contents([skill_dir for _, skill_dir in resolved])
+    version = _version_hash(
+        max_tokens,
+        dedupe,
+        *(f"{n}:{c.version}" for (n, _), c in zip(resolved, contents)),
+        *errors,
+    )
+    if if_none_match and if_none_match.strip() == version and not cursor:
+        return _unchanged_marker(version)
+
+    def make_parts() -> Iterator[str]:
+        streams = []
+        if resolved:
+            streams = _render_skills(resolved, contents, True, max_tokens, dedupe)
+        if errors:
+            streams.append(["# Skills not loaded:\n" + "\n".join(errors)])
+        for idx, stream in enumerate(streams):
+            if idx:
+                yield "\n\n"
+            yield from stream
+
+    return _paged_response(version, make_parts, cursor)
+
+
+@mcp.tool
+@_stats.instrument
+def report_duplicate_files(min_tokens: int = 0) -> List[Dict]:
+    """
+    Hub-wide report of files that are byte-identical across enabled skills
+    (shared LICENSE files, vendored reference docs, copied templates).
+    Each group lists the copies and the tokens wasted by loading all of them;
+    groups are sorted by waste. min_tokens skips small files.
+
+    Usage:
+    Call this tool to find duplicated content worth consolidating in the hub.
+    Example: report_duplicate_files(min_tokens=200)
+    """
+    groups: Dict[str, List] = defaultdict(list)
+    for skill in _catalog.current().by_name.values():
+        if _hub_pack is not None and str(skill["path"]) in _hub_pack.skill_dirs:
+            info = _hub_pack.header["skills"][skill["name"]]
+            files = [
+                (e["path"], e["sha1"], e["size"], e["tokens"]) for e in info["files"]
+            ]
+        else:
+            manifest, _ = _manifests.manifest(skill["path"])
+            files = [(e.path, e.sha1, e.size, e.tokens) for e in manifest.files]
+        for path, sha1, size, tokens in files:
+            if tokens >= min_tokens:
+                groups[sha1].append((f"{skill['name']}/{path}", size, tokens))
+
+    report = []
+    for sha1, copies in groups.items():
+        if len(copies) < 2:
+            continue
+        tokens = copies[0][2]
+        report.append(
+            {
+                "sha1": sha1,
+                "size": copies[0][1],
+                "tokens": tokens,
+                "copies": [c[0] for c in copies],
+                "wasted_tokens": tokens * (len(copies) - 1),
+            }
+        )
+    report.sort(key=lambda g: (-g["wasted_tokens"], g["copies"][0]))
+    return report
+
+
+def _near_duplicate_groups(threshold: float) -> List[Dict]:
+    """
+    Cluster near-duplicate paragraphs over all enabled skills. Byte-identical
+    files are analysed once (report_duplicate_files covers those).
+    """
+    found = []  # (label, block, paragraph)
+    buckets: Dict[tuple, List[int]] = defaultdict(list)
+    digests = set()
+    for skill in _catalog.current().skills:
+        content = _load_skill_content(skill["path"])
+        blocks = ((content.skill_md,) if content.skill_md else ()) + content.root
+        for block in blocks + content.sub:
+            if not block.digest or block.digest in digests:
+                continue
+            digests.add(block.digest)
+            for paragraph in _paragraphs.paragraphs(block):
+                for key in _band_keys(paragraph.signature):
+                    buckets[key].append(len(found))
+                found.append((f"{skill['name']}/{block.relative}", block, paragraph))
+
+    parent = list(range(len(found)))
+    similarity: Dict[int, float] = {}
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for members in buckets.values():
+        for pos, i in enumerate(members):
+            for j in members[pos + 1 :]:
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                score = _similarity(found[i][2].signature, found[j][2].signature)
+                if score >= threshold:
+                    a, b = root(i), root(j)
+                    parent[b] = a
+                    similarity[a] = min(
+                        similarity.get(a, 1.0), similarity.get(b, 1.0), score
+                    )
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(found)):
+        clusters[root(i)].append(i)
+    groups = []
+    for head, members in clusters.items():
+        if len(members) < 2:
+            continue
+        tokens = [found[i][2].tokens for i in members]
+        groups.append(
+            {
+                "similarity": round(similarity.get(head, 1.0), 2),
+                "tokens": max(tokens),
+                "wasted_tokens": sum(tokens) - max(tokens),
+                "paragraphs": [
+                    {
+                        "file": found[i][0],
+                        "preview": " ".join(
+                            found[i][1]
+                            .text[found[i][2].start : found[i][2].end]
+                            .split()
+                        )[:120],
+                    }
+                    for i in members
+                ],
+            }
+        )
+    groups.sort(key=lambda g: (-g["wasted_tokens"], g["paragraphs"][0]["file"]))
+    return groups
+
+
+@mcp.tool
+@_stats.instrument
+def report_near_duplicates(
+    min_similarity: float = NEAR_DUP_THRESHOLD, top_k: int = 20
+) -> List[Dict]:
+    """
+    Hub-wide report of paragraphs that nearly repeat each other across enabled
+    skills (MinHash/LSH over word shingles), such as the same guidance pasted
+    into several design skills with small edits. Each group lists the files
+    and a preview of each copy; groups are sorted by wasted tokens.
+
+    Usage:
+    Call this tool to find redundant guidance worth consolidating in the hub,
+    or to judge whether get_default_skills(dedupe="near") pays off.
+    Example: report_near_duplicates(min_similarity=0.8, top_k=10)
+    """
+    if not 0 < min_similarity <= 1:
+        raise ValueError("min_similarity must be in (0, 1]")
+    top_k = max(1, min(int(top_k), 200))
+    return _near_duplicate_groups(min_similarity)[:top_k]
+
+
+@mcp.tool
+@_stats.instrument
+def search_skills(query: str, top_k: int = 5) -> List[Dict]:
+    """
+    Full-text search across all enabled skills (skill.md body and supporting files).
+    Returns the best matching files ranked by BM25, each with the skill name,
+    file path and a short snippet, so you can decide what to load.
+
+    Usage:
+    Call this tool to find which skill covers a topic before loading it.
+    Example: search_skills(query="rate limiting middleware", top_k=5)
+    """
+    top_k = max(1, min(int(top_k), 50))
+    return _backend.search(_catalog.current(), query, top_k)
+
+
+@mcp.tool
+@_stats.instrument
+def recommend_skills(task_description: str, k: int = 5) -> List[Dict]:
+    """
+    Rank the enabled dynamic skills for a task by TF-IDF cosine similarity
+    between the task text and each skill's name, description and headings.
+    Returns up to k skills with name, description and score, best first.
+
+    Usage:
+    Call this tool instead of reading every description from
+    list_available_skills when you know what the task is.
+    Example: recommend_skills(task_description="add rate limiting to the REST API", k=5)
+    """
+    k = max(1, min(int(k), 50))
+    return [
+        {
+            "name": doc["name"],
+            "description": doc["description"],
+            "score": round(score, 3),
+        }
+        for score, doc in _recommender.recommend(
+            _catalog.current(), task_description, k
+        )
+    ]
+
+
+@mcp.tool
+@_stats.instrument
+def list_skill_outline(name: str) -> List[Dict]:
+    """
+    List the markdown headings of a skill's files without loading their content.
+    Each entry has the file, the heading path (e.g. "API Design > Versioning"),
+    the heading level and the section size in bytes.
+
+    Usage:
+    Call this tool to see which sections a large skill has, then load only
+    the ones you need with load_skill_section.
+    Example: list_skill_outline(name="api-patterns")
+    """
+    skill_dir = _get_skill_dir(name)
+    items = []
+    for path in _skill_markdown_files(skill_dir):
+        relative = path.relative_to(skill_dir).as_posix()
+        for section in _outline_index.outline(path):
+            items.append(
+                {
+                    "file": relative,
+                    "heading_path": section["path"],
+                    "level": section["level"],
+                    "bytes": section["end"] - section["start"],
+                }
+            )
+    return items
+
+
+@mcp.tool
+@_stats.instrument
+def load_skill_section(name: str, heading_path: str, file: str = "") -> str:
+    """
+    Load a single markdown section (heading plus its sub-sections) from a skill.
+    heading_path is a heading path from list_skill_outline, such as
+    "API Design > Versioning", or just the last heading(s) of it.
+    Optionally restrict the lookup to one file (relative path in the skill).
+
+    Usage:
+    Call this tool instead of load_full_skill_context when you only need one section.
+    Example: load_skill_section(name="api-patterns", heading_path="Versioning")
+    """
+    skill_dir = _get_skill_dir(name)
+    wanted = [h.strip().lower() for h in heading_path.split(">") if h.strip()]
+    if not wanted:
+        raise ValueError("heading_path cannot be empty")
+
+    candidates = _skill_markdown_files(skill_dir)
+    if file:
+        candidates = [
+            p for p in candidates if p.relative_to(skill_dir).as_posix() == file
+        ]
+        if not candidates:
+            raise ValueError(f"Markdown file not found in skill {name}: {file}")
+
+    for path in candidates:
+        for section in _outline_index.outline(path):
+            parts = [
+                h.strip().lower() for h in section["path"].split(SECTION_SEPARATOR)
+            ]
+            if parts[-len(wanted) :] == wanted:
+                relative = path.relative_to(skill_dir).as_posix()
+                content = _outline_index.read_section(path, section)
+                return (
+                    f"### File: {relative} (section: {section['path']})\n\n{content}\n"
+                )
+
+    raise ValueError(f"No section '{heading_path}' found in skill {name}")
+
+
+@mcp.tool
+@_stats.instrument
+def list_skill_files(name: str) -> List[Dict]:
+    """
+    List the files of a skill with their size in bytes, whether they are text,
+    and an estimate of the tokens that loading each one costs.
+
+    Usage:
+    Call this before load_skill_file to decide which files (or ranges) to load.
+    Example: list_skill_files(name="api-patterns")
+    """
+    skill_dir = _get_skill_dir(name)
+    if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+        info = _hub_pack.header["skills"][_hub_pack.skill_dirs[str(skill_dir)]]
+        return [
+            {
+                "path": e["path"],
+                "size": e["size"],
+                "is_text": e["is_text"],
+                "tokens": e["tokens"],
+            }
+            for e in info["files"]
+        ]
+
+    manifest, _ = _manifests.manifest(skill_dir)
+    return [
+        {"path": e.path, "size": e.size, "is_text": e.is_text, "tokens": e.tokens}
+        for e in manifest.files
+    ]
+
+
+@mcp.tool
+@_stats.instrument
+def load_skill_file(
+    name: str,
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    """
+    Load one file of a skill, or only part of it.
+    Pass start_line/end_line (1-based, inclusive) or offset/length (bytes),
+    not both; with neither the whole file is returned. Ranged reads report
+    the file's total lines or bytes in the header so you can page through it.
+    skill.md is always returned whole, without its frontmatter.
+
+    Usage:
+    Call list_skill_files first to see which files are large.
+    Example: load_skill_file(name="api-patterns", path="rest.md", start_line=1, end_line=200)
+    """
+    line_range = start_line is not None or end_line is not None
+    byte_range = offset is not None or length is not None
+    if line_range and byte_range:
+        raise ValueError("Use either start_line/end_line or offset/length, not both")
+    if not line_range and not byte_range:
+        return _load_skill_file_internal(name, path)
+    return _load_skill_file_range(name, path, start_line, end_line, offset, length)
+
+
+@mcp.tool
+async def get_server_stats() -> Dict:
+    """
+    Server instrumentation: per-tool call counts, latency (mean/p50/p95/max),
+    mean time per stage, bytes and files read, response sizes and cache state.
+
+    Usage:
+    Call this tool to diagnose slow skill loading.
+    Example: get_server_stats()
+    """
+    return await _off_loop(_server_stats)
+
+
+def _server_stats() -> Dict:
+    stats = _stats.snapshot()
+    stats["caches"] = _cache_stats()
+    return stats
+
+
+def _cache_stats() -> Dict:
+    snapshot = _catalog.current()
+    return {
+        "catalog_version": snapshot.version,
+        "catalog_skills": len(snapshot.skills),
+        "context_cache": {
+            "entries": len(_context_cache._entries),
+            "bytes": _context_cache._bytes,
+            "max_bytes": _context_cache.max_bytes,
+            "hits": _context_cache.hits,
+            "misses": _context_cache.misses,
+        },
+        "search_index_docs": len(_search_index._docs),
+        "recommender_docs": len(_recommender._docs),
+        "sessions_tracked": len(_deliveries._sessions),
+        "prefetched_skills": _prefetcher.warmed,
+        "shared_skill_loads": _skill_loads.shared,
+    }
+
+
+def _metrics_dump_loop() -> None:
+    """Append a stats line to METRICS_PATH every METRICS_INTERVAL seconds when busy."""
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        if not _stats.calls_since_dump:
+            continue
+        _stats.calls_since_dump = 0
+        try:
+            record = _server_stats()
+            record["ts"] = time.time()
+            with open(METRICS_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            logging.warning(f"Could not write metrics to {METRICS_PATH}: {e}")
+
+
+class HubEvents:
+    """
+    Serves `subscriptions/listen` and fans hub change events out to clients.
+
+    Events are published from watcher threads and handed over to the server's
+    event loop, which is captured when the first client starts listening.
+    """
+
+    def __init__(self):
+        self._bus = InMemorySubscriptionBus()
+        self._handler = ListenHandler(self._bus)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def listen(self, ctx, params):
+        self._loop = asyncio.get_running_loop()
+        return await self._handler(ctx, params)
+
+    def publish(self, event) -> None:
+        """Deliver a ServerEvent to every open listen stream; safe from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # nobody is listening
+        asyncio.run_coroutine_threadsafe(self._bus.publish(event), loop)
+
+
+_hub_events = HubEvents()
+mcp._mcp_server.add_request_handler(
+    "subscriptions/listen", SubscriptionsListenRequestParams, _hub_events.listen
+)
+
+
+class _HubEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "HubWatcher"):
+        super().__init__()
+        self._watcher = watcher
+
+    def on_any_event(self, event):
+        self._watcher.notify(event.src_path)
+
+
+class HubWatcher:
+    """
+    Keeps the resident catalog fresh from filesystem events.
+
+    Uses watchdog (inotify/FSEvents/...) on the storage dir and the active
+    hub when it is installed, and otherwise polls SkillCatalog.refresh() every
+    WATCH_INTERVAL seconds. Bursts of events are coalesced into one refresh.
+    Once attached, tool calls skip the per-call stat checks, and connected
+    clients get notifications/tools/list_changed when the enabled set changes.
+
+    Listeners registered with add_listener(fn) are called after every
+    refresh as fn(changed_paths, catalog_changed). Without path events,
+    indexes over skill contents re-check their skills at most once per poll
+    (see polls).
+    """
+
+    DEBOUNCE = 0.2
+
+    def __init__(self, catalog: SkillCatalog, interval: float = WATCH_INTERVAL):
+        self._catalog = catalog
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._pending: set = set()
+        self._listeners: List = []
+        self._observer = None
+        self._hub_dir: Optional[pathlib.Path] = None
+        self._hub_watch = None
+        self._polls: Optional[int] = None
+
+    @property
+    def reports_paths(self) -> bool:
+        """True when listeners get the changed paths (watchdog is running)."""
+        return self._observer is not None
+
+    @property
+    def polls(self) -> Optional[int]:
+        """Refreshes done by the polling fallback so far, None unless it runs."""
+        return self._polls
+
+    def add_listener(self, fn) -> None:
+        self._listeners.append(fn)
+
+    def notify(self, path: str) -> None:
+        """Record a changed path (called from watchdog threads)."""
+        if f"/{CACHE_DIR_NAME}" in path.replace(os.sep, "/"):
+            return  # our own sidecar writes
+        with self._cond:
+            self._pending.add(path)
+            self._cond.notify()
+
+    def _schedule_hub(self) -> None:
+        hub_dir = self._catalog.current().contexts_dir.parent
+        if hub_dir == self._hub_dir:
+            return
+        if self._hub_watch is not None:
+            self._observer.unschedule(self._hub_watch)
+            self._hub_watch = None
+        if hub_dir.is_dir():
+            self._hub_watch = self._observer.schedule(
+                _HubEventHandler(self), str(hub_dir), recursive=True
+            )
+        self._hub_dir = hub_dir
+
+    def start(self) -> None:
+        if Observer is not None and STORAGE_DIR.is_dir():
+            self._observer = Observer()
+            self._observer.schedule(
+                _HubEventHandler(self), str(STORAGE_DIR), recursive=False
+            )
+            self._schedule_hub()
+            self._observer.start()
+            logging.info("Hub watcher started (watchdog)")
+        else:
+            self._polls = 0
+            logging.info(f"Hub watcher started (polling every {self._interval}s)")
+        self._catalog.attach_watcher()
+        threading.Thread(target=self._run, daemon=True, name="hub-watcher").start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._observer is not None:
+                    while not self._pending:
+                        self._cond.wait()
+                else:
+                    self._cond.wait(self._interval)
+            if self._observer is not None:
+                time.sleep(self.DEBOUNCE)
+            with self._cond:
+                changed, self._pending = self._pending, set()
+            try:
+                self._refresh(changed)
+            except Exception as e:
+                logging.error(f"Hub watcher refresh failed: {e}", exc_info=True)
+
+    def _refresh(self, changed: set) -> None:
+        catalog_changed = self._catalog.refresh()
+        if catalog_changed:
+            logging.info(
+                f"Hub changed on disk; catalog now v{self._catalog.current().version}"
+            )
+            if self._observer is not None:
+                self._schedule_hub()
+            _hub_events.publish(ToolsListChanged())
+        for fn in self._listeners:
+            fn(changed, catalog_changed)
+        if self._polls is not None:
+            self._polls += 1
+
+
+_watcher = HubWatcher(_catalog)
+
+
+def _skill_files(skill_dir: pathlib.Path) -> List[str]:
+    """Relative POSIX paths of all files in a skill folder, except description.md."""
+    files = []
+    for file_path in sorted(skill_dir.rglob("*")):
+        if file_path.is_file() and file_path.name.lower() != "description.md":
+            files.append(file_path.relative_to(skill_dir).as_posix())
+    return files
+
+
+def _list_skill_files_internal(name: str) -> List[str]:
+    """Internal helper: List all files in a skill folder."""
+    return _skill_files(_get_skill_dir(name))
+
+
+def _contained_path(skill_dir: pathlib.Path, relative_path: str) -> pathlib.Path:
+    """Resolve a path inside a skill folder, refusing anything that escapes it."""
+    file_path = (skill_dir / relative_path).resolve()
+
+    if not file_path.is_relative_to(skill_dir.resolve()):
+        raise ValueError("Invalid path")
+
+    return file_path
+
+
+def _resolve_skill_file(skill_dir: pathlib.Path, relative_path: str) -> pathlib.Path:
+    """Like _contained_path, but the file must also exist."""
+    file_path = _contained_path(skill_dir, relative_path)
+
+    if not file_path.exists():
+        raise ValueError(f"File not found: {relative_path}")
+
+    return file_path
+
+
+def _load_skill_file_internal(name: str, relative_path: str) -> str:
+    """Internal helper: Load a specific file from a skill."""
+    skill_dir = _get_skill_dir(name)
+    _contained_path(skill_dir, relative_path)
+    if _hub_pack is not None:
+        entry = _hub_pack.find_file(
+            name, pathlib.PurePosixPath(relative_path).as_posix()
+        )
+        if entry is not None:
+            return _hub_pack.render_loaded_file(entry)
+
+    file_path = _resolve_skill_file(skill_dir, relative_path)
+
+    if file_path.name == "description.md":
+        return "Error: description.md is a legacy metadata file and cannot be loaded directly."
+
+    if file_path.name.lower() == "skill.md":
+        try:
+            content = file_path.read_text(encoding="utf-8")
+            content = _strip_frontmatter(content)
             return f"### File: {relative_path}\n\n{content}\n"
         except Exception:
             return f"### File: {relative_path} (Error reading)\n"
@@ -472,10 +4366,335 @@ def _load_skill_file_internal(name: str, relative_path: str) -> str:
     return _read_file_safe(file_path, skill_dir)
 
 
+def _check_ranges(
+    start_line: Optional[int],
+    end_line: Optional[int],
+    offset: Optional[int],
+    length: Optional[int],
+) -> None:
+    """Reject line or byte ranges that are empty by construction or negative."""
+    if start_line is not None and start_line < 1:
+        raise ValueError("start_line must be 1 or more")
+    if end_line is not None and end_line < 1:
+        raise ValueError("end_line must be 1 or more")
+    if end_line is not None and end_line < (start_line or 1):
+        raise ValueError("end_line must not be before start_line")
+    if offset is not None and offset < 0:
+        raise ValueError("offset must not be negative")
+    if length is not None and length < 0:
+        raise ValueError("length must not be negative")
+
+
+def _load_skill_file_range(
+    name: str,
+    relative_path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> str:
+    """Internal helper: Load a line or byte range of one file of a skill."""
+    _check_ranges(start_line, end_line, offset, length)
+    skill_dir = _get_skill_dir(name)
+    _contained_path(skill_dir, relative_path)
+    relative = pathlib.PurePosixPath(relative_path).as_posix()
+    ranges = (start_line, end_line, offset, length)
+
+    if _hub_pack is not None:
+        entry = _hub_pack.find_file(name, relative)
+        if entry is not None:
+            if not entry["is_text"] or _hub_pack.is_skill_md(entry):
+                return _hub_pack.render_loaded_file(entry)
+            mm, start = _hub_pack.span(entry)
+            text, label = _line_index.read(
+                f"pack:{name}/{relative}",
+                _hub_pack.version,
+                mm,
+                start,
+                entry["length"],
+                *ranges,
+            )
+            return f"### File: {relative} ({label})\n\n{text}\n"
+
+    file_path = _resolve_skill_file(skill_dir, relative_path)
+    if file_path.name.lower() in ("skill.md", "description.md"):
+        # Small files whose frontmatter must not be exposed: no ranges
+        return _load_skill_file_internal(name, relative_path)
+    if not _is_text_file(file_path):
+        return _format_file(relative, None, is_text=False)
+
+    stamp = _stat_key(file_path)
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            text, label = _line_index.read(str(file_path), stamp, b"", 0, 0, *ranges)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                text, label = _line_index.read(
+                    str(file_path), stamp, mm, 0, size, *ranges
+                )
+    return f"### File: {relative} ({label})\n\n{text}\n"
+
+
+RESOURCE_SCHEME = "skill"
+
+
+def _skill_uri(hub: str, skill_dir: pathlib.Path, relative: str) -> str:
+    """skill://<hub>/<context>/<skill>/<path> for one skill file."""
+    parts = [hub, skill_dir.parent.name, skill_dir.name, *relative.split("/")]
+    return f"{RESOURCE_SCHEME}://" + "/".join(
+        urllib.parse.quote(part, safe="") for part in parts
+    )
+
+
+class SkillFileResource(Resource):
+    """One file of an enabled skill, published as an MCP resource."""
+
+    skill_name: str
+    skill_dir: str
+    relative: str
+    file_size: int
+    sha1: str
+
+    def get_meta(self) -> Dict:
+        meta = super().get_meta()
+        meta["skill"] = {
+            "name": self.skill_name,
+            "path": self.relative,
+            "size": self.file_size,
+            "sha1": self.sha1,
+        }
+        return meta
+
+    def to_mcp_resource(self, **overrides):
+        resource = super().to_mcp_resource(**overrides)
+        resource.size = self.file_size
+        return resource
+
+    async def read(self):
+        return await _off_loop(self._read_file)
+
+    def _read_file(self):
+        skill_dir = pathlib.Path(self.skill_dir)
+        if _hub_pack is not None:
+            entry = _hub_pack.find_file(self.skill_name, self.relative)
+            if entry is not None and entry["is_text"]:
+                content = _decode_text(_hub_pack.read(entry))
+                return (
+                    _strip_frontmatter(content)
+                    if entry["role"] == "skill_md"
+                    else content
+                )
+        file_path = _resolve_skill_file(skill_dir, self.relative)
+        if file_path.name.lower() == "skill.md":
+            return _strip_frontmatter(file_path.read_text(encoding="utf-8"))
+        if not _is_text_file(file_path):
+            return file_path.read_bytes()
+        return file_path.read_text(encoding="utf-8")
+
+
+class SkillResourceProvider(Provider):
+    """
+    Publishes every file of every enabled skill as a resource at
+    skill://<hub>/<context>/<skill>/<path>, with size and sha1 metadata.
+
+    skill.md is served without its frontmatter, binary files as blobs. Clients
+    subscribe to URIs through subscriptions/listen; the hub watcher publishes
+    resources/updated for files whose stat key changed and
+    resources/list_changed when files or skills come and go.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._known: Dict[str, tuple] = {}  # path -> (uri, stat key)
+
+    def _files(self, skill: Dict) -> List[tuple]:
+        """[(relative, absolute path, size, sha1)] for one catalog skill."""
+        skill_dir = skill["path"]
+        if _hub_pack is not None and str(skill_dir) in _hub_pack.skill_dirs:
+            info = _hub_pack.header["skills"][_hub_pack.skill_dirs[str(skill_dir)]]
+            return [
+                (e["path"], skill_dir / e["path"], e["size"], e["sha1"])
+                for e in info["files"]
+            ]
+        manifest, _ = _manifests.manifest(skill_dir)
+        return [(e.path, skill_dir / e.path, e.size, e.sha1) for e in manifest.files]
+
+    def _resource(self, snapshot, skill, relative, path, size, sha1, description):
+        uri = _skill_uri(snapshot.hub_name, skill["path"], relative)
+        mime, _ = mimetypes.guess_type(relative)
+        if relative.lower().endswith(".md"):
+            mime = "text/markdown"
+        with self._lock:
+            self._known[str(path)] = (uri, _stat_key(path))
+        return SkillFileResource(
+            uri=uri,
+            name=f"{skill['name']}/{relative}",
+            description=description,
+            mime_type=mime or "application/octet-stream",
+            skill_name=skill["name"],
+            skill_dir=str(skill["path"]),
+            relative=relative,
+            file_size=size,
+            sha1=sha1,
+        )
+
+    def _descriptions(self, snapshot, skill_dirs) -> Dict:
+        if _hub_pack is not None:
+            return _hub_pack.descriptions()
+        return _description_index.describe(snapshot.config_path.parent, skill_dirs)
+
+    async def _list_resources(self) -> List:
+        return await _off_loop(self._all_resources)
+
+    async def _get_resource(self, uri: str, version=None):
+        return await _off_loop(self._find_resource, uri)
+
+    def _all_resources(self) -> List:
+        snapshot = _catalog.current()
+        skills = list(snapshot.by_name.values())
+        descriptions = self._descriptions(snapshot, [s["path"] for s in skills])
+        resources = []
+        for skill in skills:
+            for relative, path, size, sha1 in self._files(skill):
+                description = None
+                if relative.lower() == "skill.md":
+                    description = descriptions.get(skill["path"])
+                resources.append(
+                    self._resource(
+                        snapshot, skill, relative, path, size, sha1, description
+                    )
+                )
+        return resources
+
+    def _find_resource(self, uri: str):
+        prefix = f"{RESOURCE_SCHEME}://"
+        if not uri.startswith(prefix):
+            return None
+        parts = [urllib.parse.unquote(p) for p in uri[len(prefix) :].split("/")]
+        if len(parts) < 4:
+            return None
+        hub, context, name, relative = parts[0], parts[1], parts[2], "/".join(parts[3:])
+        snapshot = _catalog.current()
+        if hub != snapshot.hub_name:
+            return None
+        skill = snapshot.by_name.get(name)
+        if skill is None or skill["path"].parent.name != context:
+            return None
+        try:
+            path = _resolve_skill_file(skill["path"], relative)
+        except ValueError:
+            return None
+        if not path.is_file() or path.name.lower() == "description.md":
+            return None
+        for rel, file_path, size, sha1 in self._files(skill):
+            if rel == relative:
+                description = None
+                if rel.lower() == "skill.md":
+                    description = _get_discovery_description(skill["path"])
+                return self._resource(
+                    snapshot, skill, rel, file_path, size, sha1, description
+                )
+        return None
+
+    def on_hub_change(self, changed: set, catalog_changed: bool) -> None:
+        """HubWatcher listener: publish resource change events."""
+        list_changed = catalog_changed
+        with self._lock:
+            known = dict(self._known)
+        # Watchdog reports the changed paths; the polling fallback re-stats
+        # every file a client has listed or read
+        candidates = [p for p in changed if p in known] if changed else list(known)
+        for path in candidates:
+            uri, key = known[path]
+            new_key = _stat_key(pathlib.Path(path))
+            if new_key == key:
+                continue
+            with self._lock:
+                if new_key is None:
+                    self._known.pop(path, None)
+                else:
+                    self._known[path] = (uri, new_key)
+            if new_key is None:
+                list_changed = True
+            else:
+                _hub_events.publish(ResourceUpdated(uri=uri))
+        if not list_changed and changed:
+            skill_dirs = [str(s["path"]) for s in _catalog.current().skills]
+            for path in changed:
+                if path not in known and os.path.isfile(path):
+                    if any(path.startswith(d + os.sep) for d in skill_dirs):
+                        list_changed = True
+                        break
+        if list_changed:
+            _hub_events.publish(ResourcesListChanged())
+
+
+_resources = SkillResourceProvider()
+mcp.add_provider(_resources)
+_watcher.add_listener(_resources.on_hub_change)
+_watcher.add_listener(_search_index.on_hub_change)
+_watcher.add_listener(_recommender.on_hub_change)
+if STORAGE_BACKEND == "sqlite":
+    _watcher.add_listener(_backend.on_hub_change)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Skills MCP Server")
+    parser.add_argument(
+        "--compile-hub",
+        nargs="?",
+        const="",
+        metavar="OUTPUT",
+        help="pack the active hub into one file (default <hub>/.mcp-cache/hub.pack) and exit",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        action="store_true",
+        help="print near-duplicate paragraph groups of the active hub as JSON and exit",
+    )
+    parser.add_argument(
+        "--pack",
+        metavar="PATH",
+        default=os.environ.get("SKILLS_MCP_PACK"),
+        help="serve skills from a compiled hub pack (env SKILLS_MCP_PACK)",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="run as a shared HTTP daemon for many agents (see mcp_shim.py)",
+    )
+    parser.add_argument("--host", default=HTTP_HOST, help="HTTP bind address")
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="HTTP port")
+    args = parser.parse_args()
+
+    if args.compile_hub is not None:
+        output = pathlib.Path(args.compile_hub) if args.compile_hub else None
+        print(f"Hub pack written to {compile_hub(output)}")
+        sys.exit(0)
+    if args.near_duplicates:
+        print(json.dumps(_near_duplicate_groups(NEAR_DUP_THRESHOLD), indent=2))
+        sys.exit(0)
+
     try:
-        logging.info("Running MCP server...")
-        mcp.run()
+        if args.pack:
+            _use_pack(pathlib.Path(args.pack).expanduser())
+        if METRICS_INTERVAL > 0:
+            threading.Thread(target=_metrics_dump_loop, daemon=True).start()
+        if WATCH_INTERVAL > 0 and _hub_pack is None:
+            _watcher.start()
+        threading.Thread(target=_recommender.warm, daemon=True).start()
+        if PREFETCH_SKILLS > 0:
+            threading.Thread(target=_prefetch_popular, daemon=True).start()
+        if args.http:
+            logging.info(
+                f"Running shared MCP daemon on http://{args.host}:{args.port}/mcp"
+            )
+            mcp.run(transport="http", host=args.host, port=args.port)
+        else:
+            logging.info("Running MCP server...")
+            mcp.run()
     except Exception as e:
         logging.critical(f"MCP server crashed: {e}", exc_info=True)
         sys.exit(1)
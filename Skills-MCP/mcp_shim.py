@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Skills MCP Shim – stdio front-end for the shared Skills MCP daemon.
+
+Each agent launches this instead of mcp_server.py. It forwards the stdio MCP
+session to one long-running `mcp_server.py --http` daemon, starting the daemon
+on first use, so all agents on the machine share one catalog, one content
+cache and one set of indexes.
+"""
+
+import logging
+import os
+import pathlib
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+logging.basicConfig(
+    filename="/tmp/skills_mcp_shim.log",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+try:
+    from fastmcp import FastMCP
+    from fastmcp.client.transports import StreamableHttpTransport
+
+    try:
+        from fastmcp.server import create_proxy
+    except ImportError:  # older fastmcp releases
+        create_proxy = FastMCP.as_proxy
+except ImportError as e:
+    logging.critical(f"Failed to import fastmcp: {e}")
+    sys.exit(1)
+
+SERVER_PATH = pathlib.Path(__file__).resolve().parent / "mcp_server.py"
+HTTP_HOST = os.environ.get("SKILLS_MCP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("SKILLS_MCP_PORT", "8765"))
+STARTUP_TIMEOUT = 15.0
+# Identifies this shim's agent to the daemon (per-session skill delivery)
+SESSION_HEADER = "X-Skills-Session"
+
+
+def _daemon_running() -> bool:
+    try:
+        with socket.create_connection((HTTP_HOST, HTTP_PORT), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def _ensure_daemon() -> None:
+    """Start `mcp_server.py --http` in the background unless it is already up."""
+    if _daemon_running():
+        return
+    logging.info(f"Starting shared daemon on {HTTP_HOST}:{HTTP_PORT}")
+    # If several shims race here, the extra daemons fail to bind and exit
+    subprocess.Popen(
+        [
+            sys.executable,
+            "-u",
+            str(SERVER_PATH),
+            "--http",
+            "--host",
+            HTTP_HOST,
+            "--port",
+            str(HTTP_PORT),
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if _daemon_running():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"Shared daemon did not start on {HTTP_HOST}:{HTTP_PORT}")
+
+
+if __name__ == "__main__":
+    try:
+        _ensure_daemon()
+        transport = StreamableHttpTransport(
+            f"http://{HTTP_HOST}:{HTTP_PORT}/mcp",
+            headers={SESSION_HEADER: uuid.uuid4().hex},
+        )
+        proxy = create_proxy(transport, name="Structured Skills Hub")
+        proxy.run(show_banner=False)
+    except Exception as e:
+        logging.critical(f"MCP shim crashed: {e}", exc_info=True)
+        sys.exit(1)
@@ -1,38 +1,314 @@
+"""
+Benchmark harness for mcp_server.py.
+
+Generates a synthetic hub (N context cells x M skills x K files, mixed
+text/binary content, nested subfolders) in a temporary HOME, then times the
+server's hot paths cold and warm (repeat calls): _get_enabled_skills,
+list_available_skills, get_default_skills and load_full_skill_context. Every
+cold call runs on a fresh module (new catalog, empty caches) with the hub's
+.mcp-cache removed, and the hub watcher, prefetching and metrics dump are
+off. Peak Python memory per operation is measured in a separate tracemalloc
+pass so it does not distort the timings.
+
+Results are compared against a stored baseline and the script exits with
+status 1 on a latency or memory regression, or when there is no baseline for
+this hub shape (record one with --update-baseline).
+
+Usage:
+    python test.py                      # run and compare against bench_baseline.json
+    python test.py --update-baseline    # record a new baseline on this machine
+    python test.py --contexts 40 --skills 25 --files 12 --depth 4
+"""
+
+import argparse
+import asyncio
 import importlib.util
 import json
+import os
+import pathlib
+import random
+import shutil
+import statistics
 import sys
+import tempfile
+import time
+import tracemalloc
 
+SERVER_PATH = pathlib.Path(__file__).resolve().parent / "mcp_server.py"
+DEFAULT_BASELINE = pathlib.Path(__file__).resolve().parent / "bench_baseline.json"
 
-def run_test():
-    print("--- Testing list_available_skills logic from mcp_server.py ---")
-    try:
-        spec = importlib.util.spec_from_file_location("mcp_server", "./mcp_server.py")
-        if spec is None or spec.loader is None:
-            print("Error: Could not load mcp_server.py")
-            return
-        mcp_server_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mcp_server_module)
-
-        items = []
-        for skill in mcp_server_module._get_enabled_skills():
-            items.append(
-                {
-                    "name": skill["name"],
-                    "description": mcp_server_module._get_discovery_description(
-                        skill["path"]
-                    ),
-                    "mode": skill["mode"],
-                    "type": skill["type"],
-                }
+WORDS = (
+    "api cache context skill token index query file hub agent design pattern "
+    "latency memory async thread request response schema database migration "
+    "component render layout testing deploy security review config module"
+).split()
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _markdown(rng: random.Random, sections: int) -> str:
+    parts = [f"# {_paragraph(rng, 3)[:-1]}\n"]
+    for idx in range(sections):
+        parts.append(f"## Section {idx} {rng.choice(WORDS)}\n")
+        parts.append(_paragraph(rng, rng.randint(40, 120)) + "\n")
+        if idx % 3 == 0:
+            parts.append("```python\nprint('example')\n```\n")
+    return "\n".join(parts)
+
+
+def _skill_md(rng: random.Random, name: str) -> str:
+    description = _paragraph(rng, rng.randint(8, 30))
+    if rng.random() < 0.3:
+        # Quoted multi-line description, like imported GitHub skills use
+        half = len(description) // 2
+        desc_line = f'"{description[:half]}\n  {description[half:]}"'
+    else:
+        desc_line = description
+    return f"---\nname: {name}\ndescription: {desc_line}\n---\n\n" + _markdown(
+        rng, rng.randint(3, 12)
+    )
+
+
+def generate_hub(home: pathlib.Path, args) -> dict:
+    """Create ~/contextmanager with one synthetic active hub under `home`."""
+    rng = random.Random(args.seed)
+    storage = home / "contextmanager"
+    hub_dir = storage / "hubs" / "BenchHub"
+    cells = []
+    counts = {"skills": 0, "files": 0, "bytes": 0}
+
+    for c in range(args.contexts):
+        folder = f"context-{c:03d}"
+        ctx_dir = hub_dir / "contexts" / folder
+        toggles = {}
+        for k in range(args.skills):
+            name = f"skill-{c:03d}-{k:03d}"
+            skill_dir = ctx_dir / name
+            skill_dir.mkdir(parents=True)
+            (skill_dir / "skill.md").write_text(_skill_md(rng, name), encoding="utf-8")
+            for f in range(args.files):
+                if f % 3 == 0:
+                    sub = skill_dir
+                else:
+                    depth = rng.randint(1, args.depth)
+                    sub = skill_dir.joinpath(*(f"dir{d}" for d in range(depth)))
+                    sub.mkdir(parents=True, exist_ok=True)
+                if rng.random() < args.binary_ratio:
+                    path = sub / f"asset-{f}.png"
+                    path.write_bytes(rng.randbytes(rng.randint(512, 8192)))
+                else:
+                    path = sub / f"ref-{f}.md"
+                    path.write_text(_markdown(rng, rng.randint(2, 8)), encoding="utf-8")
+                counts["files"] += 1
+                counts["bytes"] += path.stat().st_size
+            roll = rng.random()
+            toggles[name] = {
+                "enabled": roll > 0.1,
+                "mode": "always_loaded" if roll > 1 - args.always_ratio else "dynamic",
+            }
+            counts["skills"] += 1
+        cells.append(
+            {"name": folder, "folder": folder, "enabled": True, "skills": toggles}
+        )
+
+    (hub_dir / "config.json").write_text(
+        json.dumps({"context_cells": cells}, indent=2), encoding="utf-8"
+    )
+    (storage / "master-config.json").write_text(
+        json.dumps({"active_hub": "BenchHub", "hubs": ["BenchHub"]}), encoding="utf-8"
+    )
+    return counts
+
+
+def load_server():
+    """Import a fresh copy of mcp_server.py (new module, empty in-memory caches)."""
+    spec = importlib.util.spec_from_file_location(
+        f"mcp_server_bench_{time.perf_counter_ns()}", SERVER_PATH
+    )
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"Could not load {SERVER_PATH}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def operations(server, dynamic_names, run):
+    """Hot paths to time; `run` drives the async tools to completion."""
+    return {
+        "_get_enabled_skills": lambda: server._get_enabled_skills(),
+        "list_available_skills": lambda: run(server.list_available_skills()),
+        "get_default_skills": lambda: run(server.get_default_skills()),
+        "load_full_skill_context": lambda: [
+            run(server.load_full_skill_context(name)) for name in dynamic_names
+        ],
+    }
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def cold_operation(hub_dir: pathlib.Path, op: str, dynamic_names, run):
+    """The operation `op` on a fresh module, with the hub's sidecar caches removed."""
+    shutil.rmtree(hub_dir / ".mcp-cache", ignore_errors=True)
+    server = load_server()
+    if op == "_get_enabled_skills":
+        # Importing the module already built the catalog; start from an empty one
+        server._catalog = server.SkillCatalog()
+    return operations(server, dynamic_names, run)[op]
+
+
+def run_benchmark(hub_dir: pathlib.Path, args) -> dict:
+    server = load_server()
+    dynamic = [
+        s["name"] for s in server._get_enabled_skills() if s["mode"] == "dynamic"
+    ]
+    dynamic_names = dynamic[: args.loads]
+    op_names = list(operations(server, dynamic_names, None))
+
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+
+    # Timing pass: cold = first call on a fresh module, warm = median of repeats
+    results = {}
+    for op in op_names:
+        fn = cold_operation(hub_dir, op, dynamic_names, run)
+        cold = _timed(fn)
+        warm = statistics.median(_timed(fn) for _ in range(args.repeat))
+        results[op] = {"cold_ms": round(cold, 3), "warm_ms": round(warm, 3)}
+
+    # Memory pass: peak of the cold call, again on a fresh module per operation
+    tracemalloc.start()
+    for op in op_names:
+        fn = cold_operation(hub_dir, op, dynamic_names, run)
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        results[op]["peak_kb"] = round((peak - base) / 1024, 1)
+    tracemalloc.stop()
+    loop.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """Return human-readable regressions of results against the baseline."""
+    regressions = []
+    for op, metrics in results.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(op, {}).get(metric)
+            if expected is None:
+                continue
+            slack = slack_ms if metric.endswith("_ms") else 64.0
+            limit = expected * (1 + tolerance) + slack
+            if value > limit:
+                regressions.append(
+                    f"{op}.{metric}: {value} > {round(limit, 3)} (baseline {expected})"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--contexts", type=int, default=10, help="context cells")
+    parser.add_argument("--skills", type=int, default=20, help="skills per context")
+    parser.add_argument("--files", type=int, default=8, help="extra files per skill")
+    parser.add_argument("--depth", type=int, default=3, help="max subfolder depth")
+    parser.add_argument("--binary-ratio", type=float, default=0.15)
+    parser.add_argument("--always-ratio", type=float, default=0.1)
+    parser.add_argument("--loads", type=int, default=10, help="dynamic skills to load")
+    parser.add_argument("--repeat", type=int, default=5, help="warm repetitions")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5, help="allowed relative slowdown"
+    )
+    parser.add_argument(
+        "--slack-ms", type=float, default=2.0, help="absolute slack for timings"
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the generated hub")
+    args = parser.parse_args()
+
+    shape = {
+        k: getattr(args, k)
+        for k in (
+            "contexts",
+            "skills",
+            "files",
+            "depth",
+            "binary_ratio",
+            "always_ratio",
+            "loads",
+            "seed",
+        )
+    }
+    baseline = None
+    if not args.update_baseline:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}; record one with --update-baseline")
+            return 1
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("shape") != shape:
+            print(
+                f"Baseline shape {baseline.get('shape')} differs from {shape}; "
+                "record one for this shape with --update-baseline"
             )
-        result = sorted(items, key=lambda x: x["name"])
-        print(json.dumps(result, indent=2))
-    except Exception as e:
-        print(f"An error occurred during execution: {e}", file=sys.stderr)
-        import traceback
+            return 1
+
+    home = pathlib.Path(tempfile.mkdtemp(prefix="skills-mcp-bench-"))
+    # Background threads would compete with the measured calls
+    env = {
+        "HOME": str(home),
+        "SKILLS_MCP_WATCH_INTERVAL": "0",
+        "SKILLS_MCP_PREFETCH": "0",
+        "SKILLS_MCP_METRICS_INTERVAL": "0",
+    }
+    previous_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        counts = generate_hub(home, args)
+        print(
+            f"Synthetic hub: {args.contexts} contexts, {counts['skills']} skills, "
+            f"{counts['files']} files, {counts['bytes'] // 1024} KB"
+        )
+        results = run_benchmark(home / "contextmanager" / "hubs" / "BenchHub", args)
+    finally:
+        for key, value in previous_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        if args.keep:
+            print(f"Hub kept at {home}")
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+
+    print(f"{'operation':<26}{'cold ms':>10}{'warm ms':>10}{'peak KB':>10}")
+    for op, m in results.items():
+        print(f"{op:<26}{m['cold_ms']:>10}{m['warm_ms']:>10}{m['peak_kb']:>10}")
+
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps({"shape": shape, "results": results}, indent=2) + "\n",
+            encoding="utf-8",
+        )
+        print(f"Baseline written to {args.baseline}")
+        return 0
 
-        traceback.print_exc()
+    regressions = compare(results, baseline["results"], args.tolerance, args.slack_ms)
+    if regressions:
+        print("REGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("No regressions against baseline.")
+    return 0
 
 
 if __name__ == "__main__":
-    run_test()
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Unit tests for mcp_server.py. Run with: python -m pytest -q test_mcp_server.py
+
+Each test module gets a fresh copy of the server loaded against a small hub
+in a temporary HOME, with the watcher, metrics dump and prefetching off.
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import pathlib
+import time
+import types
+
+import pytest
+
+SERVER_PATH = pathlib.Path(__file__).resolve().parent / "mcp_server.py"
+
+SKILL_MD = "---\nname: {name}\ndescription: The {name} skill.\n---\n\n# {name}\n"
+
+# Shared verbatim by the beta and gamma skills
+SHARED_MD = (
+    "# Conventions\n\n" + " ".join(f"shared rule {i}." for i in range(40)) + "\n"
+)
+
+# A paragraph that gamma repeats with one word changed
+PARAGRAPH = " ".join(f"word{i}" for i in range(60))
+
+
+def _write_hub(home: pathlib.Path) -> None:
+    storage = home / "contextmanager"
+    ctx_dir = storage / "hubs" / "TestHub" / "contexts" / "main"
+    for name in ("alpha", "alpha-private", "blank", "beta", "gamma"):
+        skill_dir = ctx_dir / name
+        skill_dir.mkdir(parents=True)
+        (skill_dir / "skill.md").write_text(SKILL_MD.format(name=name))
+    (ctx_dir / "blank" / "skill.md").write_text("")
+    (ctx_dir / "alpha" / "empty.md").write_text("")
+    (ctx_dir / "alpha" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(100))
+    (ctx_dir / "alpha" / "notes.md").write_text(
+        "".join(f"line {i}\n" for i in range(1, 11))
+    )
+    (ctx_dir / "alpha-private" / "secret.md").write_text("do not leak\n")
+    for name in ("beta", "gamma"):
+        (ctx_dir / name / "shared.md").write_text(SHARED_MD)
+    (ctx_dir / "beta" / "intro.md").write_text(f"# Intro\n\n{PARAGRAPH}\n")
+    (ctx_dir / "gamma" / "overview.md").write_text(
+        f"# Overview\n\n{PARAGRAPH.replace('word30', 'changed')}\n"
+    )
+    skills = {
+        "alpha": {"enabled": True, "mode": "dynamic"},
+        "alpha-private": {"enabled": False, "mode": "dynamic"},
+        "blank": {"enabled": True, "mode": "dynamic"},
+        "beta": {"enabled": True, "mode": "always_loaded"},
+        "gamma": {"enabled": True, "mode": "always_loaded"},
+    }
+    config = {
+        "context_cells": [
+            {"name": "main", "folder": "main", "enabled": True, "skills": skills}
+        ]
+    }
+    (storage / "hubs" / "TestHub" / "config.json").write_text(json.dumps(config))
+    (storage / "master-config.json").write_text(
+        json.dumps({"active_hub": "TestHub", "hubs": ["TestHub"]})
+    )
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    home = tmp_path_factory.mktemp("home")
+    _write_hub(home)
+    env = {
+        "HOME": str(home),
+        "SKILLS_MCP_WATCH_INTERVAL": "0",
+        "SKILLS_MCP_METRICS_INTERVAL": "0",
+        "SKILLS_MCP_PREFETCH": "0",
+    }
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location(
+        f"mcp_server_test_{time.perf_counter_ns()}", SERVER_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    for key, value in saved.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+
+@pytest.mark.parametrize(
+    "path", ["../alpha-private/secret.md", "../../main/alpha-private/secret.md"]
+)
+def test_file_outside_skill_is_rejected(server, path):
+    with pytest.raises(ValueError, match="Invalid path"):
+        server._load_skill_file_internal("alpha", path)
+    with pytest.raises(ValueError, match="Invalid path"):
+        server._load_skill_file_range("alpha", path, start_line=1, end_line=1)
+
+
+def test_pack_matches_folders(server, tmp_path, monkeypatch):
+    pack = server.HubPack(server.compile_hub(tmp_path / "hub.pack"))
+    loaded = {}
+    for name in ("alpha", "blank"):
+        manifest, _ = server._manifests.manifest(server._get_skill_dir(name))
+        assert pack.skill_version(name) == manifest.version
+        sizes = {e["path"]: e["size"] for e in pack.header["skills"][name]["files"]}
+        assert sizes == {e.path: e.size for e in manifest.files}
+        for entry in manifest.files:
+            loaded[name, entry.path] = (
+                server._load_skill_file_internal(name, entry.path),
+                server._load_skill_file_range(name, entry.path),
+            )
+    monkeypatch.setattr(server, "_hub_pack", pack)
+    for (name, path), texts in loaded.items():
+        assert server._load_skill_file_internal(name, path) == texts[0], path
+        assert server._load_skill_file_range(name, path) == texts[1], path
+
+
+def test_line_range(server):
+    text = server._load_skill_file_range("alpha", "notes.md", start_line=2, end_line=3)
+    assert "(lines 2-3 of 10)" in text
+    assert "line 2\nline 3\n" in text
+    assert "line 4" not in text
+
+
+@pytest.mark.parametrize(
+    "ranges",
+    [
+        {"start_line": 1, "end_line": 0},
+        {"start_line": 0},
+        {"start_line": -1, "end_line": 2},
+        {"start_line": 5, "end_line": 2},
+        {"end_line": -3},
+        {"offset": -1},
+        {"offset": 0, "length": -5},
+    ],
+)
+def test_invalid_range_is_rejected(server, ranges):
+    with pytest.raises(ValueError):
+        server._load_skill_file_range("alpha", "notes.md", **ranges)
+
+
+def test_empty_files_are_text(server):
+    alpha = server._load_skill_content(server._get_skill_dir("alpha"))
+    empty = next(b for b in alpha.root if b.relative == "empty.md")
+    assert empty.text == "### File: empty.md\n\n\n"
+    blank = server._load_skill_content(server._get_skill_dir("blank"))
+    assert blank.skill_md.text == "# Main Skill File: skill.md\n\n\n"
+
+
+BUNDLED_HUB = pathlib.Path(__file__).resolve().parent.parent / "MySkillsHUB"
+
+
+def test_digest_stays_within_ratio(server):
+    ratio = server.DIGEST_RATIO
+    full = digest = 0
+    for path in sorted(BUNDLED_HUB.rglob("*.md")):
+        text = path.read_text(encoding="utf-8")
+        tokens = server._estimate_tokens(text)
+        digest_tokens = server._estimate_tokens(server._digest_markdown(text))
+        assert digest_tokens <= max(ratio * tokens, server.DIGEST_MIN_TOKENS), path
+        full += tokens
+        digest += digest_tokens
+    assert full > 0
+    assert digest <= ratio * full
+
+
+def _call(tool, **kwargs) -> str:
+    """Run an (async) tool to completion."""
+    return asyncio.run(tool(**kwargs))
+
+
+def _pages(tool, **kwargs) -> list:
+    """Every page of a tool response, with the NEXT_CURSOR markers cut off."""
+    pages, cursor = [], None
+    while True:
+        text = _call(tool, cursor=cursor, **kwargs)
+        if "\n<<NEXT_CURSOR " not in text:
+            return pages + [text]
+        body, _, marker = text.partition("\n<<NEXT_CURSOR ")
+        pages.append(body)
+        cursor = marker.split(">>", 1)[0]
+
+
+@pytest.mark.parametrize(
+    "tool, kwargs",
+    [
+        ("get_default_skills", {}),
+        ("load_full_skill_context", {"name": "alpha"}),
+        ("load_skills", {"names": ["alpha", "beta", "gamma"]}),
+    ],
+)
+def test_pages_reassemble_to_full_response(server, monkeypatch, tool, kwargs):
+    tool = getattr(server, tool)
+    monkeypatch.setattr(server, "PAGE_BYTES", 0)
+    full = _call(tool, **kwargs)
+    monkeypatch.setattr(server, "PAGE_BYTES", 128)
+    # Assemblies are cached per response version with the page size of the time
+    monkeypatch.setattr(server, "_assemblies", server.AssemblyCache())
+    pages = _pages(tool, **kwargs)
+    assert len(pages) > 1
+    assert "".join(pages) == full
+
+
+def test_expired_cursor_is_rejected(server):
+    with pytest.raises(ValueError, match="Cursor expired"):
+        _call(server.get_default_skills, cursor="0123456789abcdef:1")
+
+
+def test_shared_file_is_emitted_once(server):
+    text = _call(server.get_default_skills)
+    assert text.count(SHARED_MD) == 1
+    assert (
+        "### File: shared.md\n[Identical to beta/shared.md above; not repeated.]"
+        in text
+    )
+    assert _call(server.get_default_skills, dedupe="none").count(SHARED_MD) == 2
+
+
+def test_near_duplicate_paragraph_is_dropped(server):
+    assert PARAGRAPH.replace("word30", "changed") in _call(server.get_default_skills)
+    text = _call(server.get_default_skills, dedupe="near")
+    assert PARAGRAPH in text
+    assert PARAGRAPH.replace("word30", "changed") not in text
+    assert "[Near-duplicate of a paragraph in beta/intro.md; omitted.]" in text
+
+
+def test_max_tokens_omits_files(server):
+    text = _call(server.get_default_skills, max_tokens=120)
+    assert "# Main Skill File: skill.md\n\n# beta" in text
+    assert "# --- Omitted Files (over max_tokens budget) ---" in text
+    assert server._estimate_tokens(text) <= 120 + 2 * server.SKILL_WRAPPER_TOKENS
+
+
+def test_session_skips_delivered_skills(server):
+    server._deliveries.restart_stdio()
+    ctx = types.SimpleNamespace(transport="stdio")
+    full = _call(server.get_default_skills, ctx=ctx)
+    assert SHARED_MD in full
+    again = _call(server.get_default_skills, resend=False, ctx=ctx)
+    assert SHARED_MD not in again
+    assert "# Already in context" in again and "beta, gamma" in again
+    assert _call(server.get_default_skills, ctx=ctx) == full